@@ -23,7 +23,7 @@ with st.echo():
 
 st.write("""### The data""")
 with st.echo():
-    df = Spreadsheet().get_data('train.csv',columns=['Survived','Pclass','Sex','Age'])
+    df = Spreadsheet().get_data('train.csv',columns=['Survived','Pclass','Sex','Age'],categories=0.5)
 
 st.write(df.head(5))
 
@@ -0,0 +1,360 @@
+"""
+Benchmarks of the Tester hot paths, runnable offline from the root of the repository:
+
+    python -m benchmarks.tester --sizes 1e3 1e5 1e7 --history benchmarks/history.json
+
+Every benchmark is run on synthetic data of each size (and of each combination of its parameters, such as
+the branch of the automatic test selection, the cardinality of categorical samples or the number of columns).
+The best and median wall time over the repeats and the peak memory allocated during one call are recorded,
+appended to a JSON history and compared with the previous run of the same benchmark on the same machine.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import scipy
+from ml.preprocessing.hypothesis_testing import Tester
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+
+
+def quantitative(n, kind, rng):
+    """
+    Synthetic quantitative sample
+
+	Parameters
+	----------
+    n : int
+              number of observations
+    kind : string
+              one of `normal`, `skewed` or `binary`
+    rng : np.random.Generator
+              random number generator
+
+	Returns
+	-------
+    np.ndarray
+    """
+    if kind == 'normal':
+        return rng.standard_normal(n)
+    elif kind == 'skewed':
+        return rng.standard_exponential(n)
+    elif kind == 'binary':
+        return rng.integers(0, 2, n)
+    raise Exception('Invalid kind. Choose one of `normal`, `skewed` or `binary`.')
+
+
+def correlated(n, kind, rng, rho = 0.1):
+    """
+    Pair of synthetic quantitative samples with a weak correlation
+
+	Parameters
+	----------
+    n : int
+              number of observations
+    kind : string
+              one of `normal`, `skewed` or `binary`
+    rng : np.random.Generator
+              random number generator
+    rho : float
+              correlation of the underlying normal samples
+
+	Returns
+	-------
+    tuple
+        (sample1, sample2)
+    """
+    x = rng.standard_normal(n)
+    y = rho * x + np.sqrt(1 - rho ** 2) * rng.standard_normal(n)
+    if kind == 'skewed':
+        return np.exp(x), np.exp(y)
+    elif kind == 'binary':
+        return (x > 0).astype(np.int64), (y > 0).astype(np.int64)
+    return x, y
+
+
+def categorical(n, cardinality, columns, rng):
+    """
+    Synthetic table of categorical samples, every column with the given number of categories
+
+	Parameters
+	----------
+    n : int
+              number of observations
+    cardinality : int
+              number of categories of every column
+    columns : int
+              number of columns
+    rng : np.random.Generator
+              random number generator
+
+	Returns
+	-------
+    pd.DataFrame
+    """
+    return pd.DataFrame({'c{}'.format(j): rng.integers(0, cardinality, n, dtype = np.int32) for j in range(columns)})
+
+
+def correlation_test(n, rng, branch):
+    x, y = correlated(n, {'auto-binary': 'binary', 'auto-pearson': 'normal', 'auto-spearman': 'skewed'}.get(branch, 'normal'), rng)
+    method = None if branch.startswith('auto') else branch
+    return lambda tester: tester.correlation_test(x, y, method = method)
+
+
+def correlation_matrix(n, rng, columns):
+    df = pd.DataFrame(rng.standard_normal((n, columns)))
+    return lambda tester: tester.correlation_matrix(df, method = 'pearson')
+
+
+def categorical_test(n, rng, branch, cardinality):
+    df = categorical(n, 2 if branch == 'fisher' else cardinality, 2, rng)
+    return lambda tester: tester.categorical_test(df, 'c0', 'c1', method = branch)
+
+
+def categorical_screen(n, rng, cardinality, columns):
+    df = categorical(n, cardinality, columns, rng)
+    return lambda tester: tester.categorical_screen(df)
+
+
+def normality_test(n, rng, branch):
+    sample = rng.standard_normal(n)
+    return lambda tester: tester.normality_test(sample, method = branch)
+
+
+def group_test(n, rng, branch, groups):
+    df = pd.DataFrame({'value': quantitative(n, 'skewed' if branch == 'auto-rank' else 'normal', rng),
+                       'group': rng.integers(0, groups, n)})
+    method = None if branch.startswith('auto') else branch
+    if method in ('ttest', 'mannwhitney') and groups > 2:
+        method = {'ttest': 'anova', 'mannwhitney': 'kruskal'}[method]
+    return lambda tester: tester.group_test(df, 'value', 'group', method = method)
+
+
+# benchmark: (parameter grid, largest number of rows it is run with)
+BENCHMARKS = {correlation_test: ({'branch': ['auto-binary', 'auto-pearson', 'auto-spearman', 'kendall']}, 10 ** 8),
+              correlation_matrix: ({'columns': [10, 50]}, 10 ** 7),
+              categorical_test: ({'branch': ['fisher', 'chi2'], 'cardinality': [10, 1000]}, 10 ** 8),
+              categorical_screen: ({'cardinality': [2, 20], 'columns': [10, 40]}, 10 ** 7),
+              normality_test: ({'branch': ['auto', 'shapiro', 'normaltest', 'jarque_bera']}, 10 ** 8),
+              group_test: ({'branch': ['auto-parametric', 'auto-rank', 'ttest', 'mannwhitney'], 'groups': [2, 10]}, 10 ** 8)}
+
+# the Kendall tau is O(n log n) with a large constant, it is not run on larger samples
+LIMITS = {('correlation_test', 'kendall'): 10 ** 6}
+
+
+def grid(parameters):
+    """
+    Every combination of the values of the parameters, removing duplicates that do not apply
+
+	Parameters
+	----------
+    parameters : dict
+              values of each parameter
+
+	Returns
+	-------
+    list
+        one dict per combination
+    """
+    combinations = [dict(zip(parameters, values)) for values in itertools.product(*parameters.values())]
+    return [params for params in combinations if not (params.get('branch') == 'fisher' and params.get('cardinality', 0) > 10)]
+
+
+def measure(run, repeats = 5, min_time = 0.2, memory = True):
+    """
+    Times a benchmark, each repeat with a new lightweight Tester so that no result or data kind is reused
+    and no report is rendered. Warnings raised by the tests are silenced.
+
+	Parameters
+	----------
+    run : callable
+              function of a Tester running the benchmark once
+    repeats : int
+              maximum number of repeats
+    min_time : float
+              the repeats stop once their total time exceeds min_time seconds, at least one is always run
+    memory : bool
+              if the peak memory allocated by one more call is traced
+
+	Returns
+	-------
+    dict
+        best and median seconds, number of repeats and peak bytes allocated
+    """
+    times = []
+    peak = None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        while not times or (len(times) < repeats and sum(times) < min_time):
+            tester = Tester(lightweight = True)
+            start = time.perf_counter()
+            run(tester)
+            times.append(time.perf_counter() - start)
+        if memory:
+            tracemalloc.start()
+            try:
+                run(Tester(lightweight = True))
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    return {'best': min(times), 'median': float(np.median(times)), 'repeats': len(times), 'peak_bytes': peak}
+
+
+def machine():
+    """
+    Description of the machine and of the versions of the libraries, runs are only compared on the same machine
+
+	Parameters
+	----------
+
+	Returns
+	-------
+    dict
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True,
+                                cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'host': platform.node(), 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpus': os.cpu_count(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'scipy': scipy.__version__, 'commit': commit}
+
+
+def key(record):
+    return record['benchmark'], json.dumps(record['params'], sort_keys = True), record['n']
+
+
+def run(sizes = SIZES, select = None, repeats = 5, min_time = 0.2, memory = True, seed = 0, out = sys.stdout):
+    """
+    Runs the benchmarks
+
+	Parameters
+	----------
+    sizes : list
+              numbers of rows of the synthetic data
+    select : string
+              only benchmarks whose name contains select are run
+    repeats, min_time : int, float
+              see measure
+    memory : bool
+              if peak memory is traced
+    seed : int
+              seed of the synthetic data
+    out : file
+              where progress is written, None for no output
+
+	Returns
+	-------
+    list
+        one record per benchmark, parameters and size
+    """
+    records = []
+    for benchmark, (parameters, max_rows) in BENCHMARKS.items():
+        name = benchmark.__name__
+        if select and not select in name:
+            continue
+        for params in grid(parameters):
+            limit = min(max_rows, LIMITS.get((name, params.get('branch')), max_rows))
+            for n in sizes:
+                n = int(n)
+                if n > limit:
+                    continue
+                rng = np.random.default_rng(seed)
+                result = measure(benchmark(n, rng, **params), repeats, min_time, memory)
+                record = {'benchmark': name, 'params': params, 'n': n, **result,
+                          'rows_per_second': n / result['best'] if result['best'] else None}
+                records.append(record)
+                if out is not None:
+                    peak = '' if result['peak_bytes'] is None else '{:>10.1f} MiB'.format(result['peak_bytes'] / 2 ** 20)
+                    print('{:<20} {:<45} n={:<10} {:>10.4f} s{}'.format(name, json.dumps(params), n, result['best'], peak),
+                          file = out, flush = True)
+    return records
+
+
+def compare(records, history, threshold = 0.2):
+    """
+    Compares the records with the last run of the same benchmarks on the same machine in the history
+
+	Parameters
+	----------
+    records : list
+              records of the current run
+    history : list
+              previous runs, as stored in the JSON history
+    threshold : float
+              relative slowdown of the best time above which a record is a regression
+
+	Returns
+	-------
+    pd.DataFrame
+        one row per record with a previous time, with columns benchmark, params, n, previous, current, ratio and regression
+    """
+    host = machine()
+    previous = {}
+    for entry in history:
+        if all(entry['machine'].get(field) == host[field] for field in ('host', 'processor', 'cpus')):
+            previous.update({key(record): record['best'] for record in entry['records']})
+    rows = [(record['benchmark'], json.dumps(record['params']), record['n'], previous[key(record)], record['best'])
+            for record in records if key(record) in previous]
+    df = pd.DataFrame(rows, columns = ['benchmark', 'params', 'n', 'previous', 'current'])
+    df['ratio'] = df['current'] / df['previous']
+    df['regression'] = df['ratio'] > 1 + threshold
+    return df
+
+
+def load(path):
+    if path and os.path.exists(path):
+        with open(path) as file:
+            return json.load(file)
+    return []
+
+
+def save(path, history):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(history, file, indent = 1)
+    os.replace(tmp, path)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmarks of the Tester hot paths.')
+    parser.add_argument('--sizes', nargs = '+', type = float, default = SIZES,
+                        help = 'numbers of rows of the synthetic data, from 1e3 to 1e8')
+    parser.add_argument('--select', help = 'only run benchmarks whose name contains this string')
+    parser.add_argument('--repeats', type = int, default = 5)
+    parser.add_argument('--min-time', type = float, default = 0.2)
+    parser.add_argument('--no-memory', action = 'store_true', help = 'do not trace peak memory')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--history', default = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.json'),
+                        help = 'JSON file the run is appended to')
+    parser.add_argument('--threshold', type = float, default = 0.2,
+                        help = 'relative slowdown reported as a regression')
+    parser.add_argument('--fail-on-regression', action = 'store_true')
+    args = parser.parse_args(argv)
+
+    records = run(args.sizes, args.select, args.repeats, args.min_time, not args.no_memory, args.seed)
+    history = load(args.history)
+    comparison = compare(records, history, args.threshold)
+    history.append({'timestamp': datetime.now(timezone.utc).isoformat(), 'machine': machine(), 'records': records})
+    save(args.history, history)
+    regressions = comparison[comparison['regression']]
+    if len(comparison):
+        print('\n{} of {} benchmarks slower than the previous run by more than {:.0%}'.format(
+            len(regressions), len(comparison), args.threshold))
+        if len(regressions):
+            print(regressions.to_string(index = False))
+    return 1 if args.fail_on_regression and len(regressions) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,92 @@
 from abc import ABC, abstractmethod
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import pandas as pd
 
 class DataSource(ABC):
-    
+
     @abstractmethod
     def get_data(self) -> pd.DataFrame:
         """
         Abstract method that is implemented in classes that inherit it
         """
         pass
-         
+
+    async def aget_data(self, *args, executor = None, **kwargs) -> pd.DataFrame:
+        """
+        Awaitable version of get_data, run in a worker thread so that the event loop, and other
+        sources, are not blocked while the file is parsed or the query is fetched
+
+        Parameters
+        -----------
+        args, kwargs :
+                       arguments of get_data
+
+        executor : concurrent.futures.Executor
+                   executor running get_data, if None the default executor of the event loop
+
+        Returns
+        -------
+        pd.DataFrame
+            Dataframe with data
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(self.get_data, *args, **kwargs))
+
+
+def _requests(requests):
+    items = requests.items() if isinstance(requests, dict) else enumerate(requests)
+    return [(name, source, dict(kwargs)) for name, (source, kwargs) in items]
+
+
+def _results(requests, frames):
+    return dict(frames) if isinstance(requests, dict) else [frame for _, frame in frames]
+
+
+def load_all(requests, max_workers = 4):
+    """
+    Loads several sources concurrently in a pool of threads, so that the total time is about the one
+    of the slowest source instead of the sum
+
+    Parameters
+    -----------
+    requests : dict or list
+               (source, kwargs) pairs, where kwargs are the arguments of source.get_data, e.g.
+               {'train': (Spreadsheet(), {'path': 'train.csv'}), 'sales': (db, {'query': 'sales'})}
+
+    max_workers : int
+                  maximum number of sources loaded at the same time
+
+    Returns
+    -------
+    dict or list
+        Dataframe of every request, with the same keys or order as requests
+    """
+    pending = _requests(requests)
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        futures = [(name, executor.submit(source.get_data, **kwargs)) for name, source, kwargs in pending]
+        return _results(requests, [(name, future.result()) for name, future in futures])
+
+
+async def aload_all(requests, max_workers = 4):
+    """
+    Awaitable version of load_all, for callers already running an event loop
+
+    Parameters
+    -----------
+    requests : dict or list
+               (source, kwargs) pairs, see load_all
+
+    max_workers : int
+                  maximum number of sources loaded at the same time
+
+    Returns
+    -------
+    dict or list
+        Dataframe of every request, with the same keys or order as requests
+    """
+    pending = _requests(requests)
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        frames = await asyncio.gather(*[source.aget_data(executor = executor, **kwargs) for _, source, kwargs in pending])
+    return _results(requests, [(name, frame) for (name, _, _), frame in zip(pending, frames)])
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import numpy as np
+import pandas as pd
+
+
+class ColumnarCache:
+    """
+    On-disk cache of parsed tables in a columnar binary layout: one directory per table with one .npy file
+    per column, so that only the requested columns are read and numerical columns can be memory-mapped
+    without copies. Text columns are stored as integer codes plus their distinct values. Entries are keyed by the
+    path, modification time and size of the source file and by the options it was parsed with, so an entry
+    goes stale as soon as the file changes; entries of older versions of a file are removed when it is cached
+    again and the total size is bounded by evicting the least recently used entries.
+    """
+
+    def __init__(self, directory, max_bytes = 2 ** 30, memory_map = False):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        directory : string
+                  directory of the cache
+        max_bytes : int
+                  maximum total size of the cache
+        memory_map : bool
+                  if numerical columns are memory-mapped copy-on-write instead of read into memory: reads
+                  are zero-copy and the columns can still be modified, changes are never written back
+
+    	Returns
+    	-------
+        ColumnarCache
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_map = memory_map
+        os.makedirs(directory, exist_ok = True)
+
+    def key(self, path, options = None):
+        """
+        Key of the entry of a file parsed with some options
+
+    	Parameters
+    	----------
+        path : string
+                  path of the source file
+        options : dict
+                  options the file is parsed with
+
+    	Returns
+    	-------
+        string
+        """
+        stat = os.stat(path)
+        # the leading version tells apart the entries stored before the index was kept
+        description = repr((2, os.path.abspath(path), stat.st_mtime_ns, stat.st_size, sorted((options or {}).items())))
+        return hashlib.blake2b(description.encode(), digest_size = 16).hexdigest()
+
+    def get(self, key, columns = None):
+        """
+        Returns the cached table for key, or None
+
+    	Parameters
+    	----------
+        key : string
+                  key of the entry
+        columns : list
+                  columns read, if None every column is read
+
+    	Returns
+    	-------
+        pd.DataFrame
+        """
+        entry = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as file:
+                meta = json.load(file)
+            positions = {name: i for i, name in enumerate(meta['columns'])}
+            index = None
+            if meta['index'] is not None:
+                levels = [self._read(entry, 'index{}'.format(i), kind) for i, kind in enumerate(meta['index']['kinds'])]
+                index = (pd.Index(levels[0], name = meta['index']['names'][0]) if len(levels) == 1 else
+                         pd.MultiIndex.from_arrays(levels, names = meta['index']['names']))
+            df = pd.DataFrame({name: self._read(entry, positions[name], meta['kinds'][positions[name]])
+                               for name in (meta['columns'] if columns is None else columns)}, index = index, copy = False)
+            os.utime(entry)
+        except (OSError, KeyError, ValueError, pickle.UnpicklingError, EOFError):
+            return None
+        return df
+
+    def put(self, key, df, source = None):
+        """
+        Stores a table for key, removing the entries of older versions of the same source file
+
+    	Parameters
+    	----------
+        key : string
+                  key of the entry
+        df : pd.DataFrame
+                  table, its index is stored along the columns unless it is the default RangeIndex
+        source : string
+                  path of the source file
+
+    	Returns
+    	-------
+        None
+        """
+        entry = os.path.join(self.directory, key)
+        tmp = '{}.{}.tmp'.format(entry, os.getpid())
+        os.makedirs(tmp, exist_ok = True)
+        kinds = [self._write(tmp, i, df.iloc[:, i]) for i in range(df.shape[1])]
+        index = None
+        if not df.index.equals(pd.RangeIndex(len(df))):
+            index = {'names': list(df.index.names),
+                     'kinds': [self._write(tmp, 'index{}'.format(i), df.index.get_level_values(i).to_series())
+                               for i in range(df.index.nlevels)]}
+        version = None
+        if source is not None:
+            source, stat = os.path.abspath(source), os.stat(source)
+            version = [stat.st_mtime_ns, stat.st_size]
+        with open(os.path.join(tmp, 'meta.json'), 'w') as file:
+            json.dump({'columns': list(df.columns), 'kinds': kinds, 'index': index, 'source': source, 'version': version}, file)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(tmp, ignore_errors = True)
+        if source is not None:
+            self._invalidate(source, version)
+        self._evict()
+
+    def clear(self):
+        """
+        Removes every entry of the cache
+        """
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors = True)
+
+    def _write(self, entry, i, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(entry, '{}.npy'.format(i)), series.cat.codes.to_numpy())
+            self._dump(entry, i, series.cat.categories)
+            return ['category', bool(series.cat.ordered)]
+        if isinstance(series.dtype, np.dtype) and not series.dtype.hasobject:
+            np.save(os.path.join(entry, '{}.npy'.format(i)), series.to_numpy())
+            return ['array', None]
+        codes, uniques = pd.factorize(series)
+        np.save(os.path.join(entry, '{}.npy'.format(i)), codes.astype(np.int32 if len(uniques) < 2 ** 31 else np.int64))
+        self._dump(entry, i, uniques)
+        return ['codes', str(series.dtype)]
+
+    def _read(self, entry, i, kind):
+        values = np.load(os.path.join(entry, '{}.npy'.format(i)), mmap_mode = 'c' if self.memory_map else None)
+        if kind[0] == 'array':
+            return values
+        with open(os.path.join(entry, '{}.pkl'.format(i)), 'rb') as file:
+            uniques = pickle.load(file)
+        categorical = pd.Categorical.from_codes(np.asarray(values), categories = uniques,
+                                                ordered = bool(kind[1]) if kind[0] == 'category' else False)
+        return categorical if kind[0] == 'category' else pd.Series(categorical).astype(kind[1]).array
+
+    def _dump(self, entry, i, uniques):
+        with open(os.path.join(entry, '{}.pkl'.format(i)), 'wb') as file:
+            pickle.dump(pd.Index(uniques), file, protocol = pickle.HIGHEST_PROTOCOL)
+
+    def _invalidate(self, source, version):
+        # entries of the same version of the file parsed with other options stay valid
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.endswith('.tmp'):
+                continue
+            try:
+                with open(os.path.join(entry.path, 'meta.json')) as file:
+                    meta = json.load(file)
+                stale = meta.get('source') == source and meta.get('version') != version
+            except (OSError, ValueError):
+                continue
+            if stale:
+                shutil.rmtree(entry.path, ignore_errors = True)
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.endswith('.tmp'):
+                size = sum(file.stat().st_size for file in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors = True)
+            total -= size
@@ -1,70 +1,411 @@
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
 import pandas as pd
 
 from ml.data_source.base import DataSource
+from ml.preprocessing.streaming import Comoments
+
+try:
+    import sqlalchemy
+except ImportError:
+    sqlalchemy = None
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+
+def quote(identifier):
+    """
+    Quotes a (possibly schema-qualified) table or column name with standard SQL double quotes
+    """
+    return '.'.join('"{}"'.format(part.replace('"', '""')) for part in str(identifier).split('.'))
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections. At most size connections are open at once, idle connections
+    are reused by later calls and connections whose transaction cannot be rolled back are discarded.
+    """
+
+    def __init__(self, connect, size = 5):
+        """
+        Constructor.
+
+        Parameters
+        -----------
+        connect : callable
+                  function without arguments returning a new DB-API connection
+
+        size : int
+               maximum number of open connections
+
+        Returns
+        -------
+        class Object
+        """
+        self.connect = connect
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of the context, waiting if size connections are in use
+
+        Parameters
+        -----------
+
+        Returns
+        -------
+        context manager
+        """
+        self.slots.acquire()
+        try:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                connection = self.connect()
+            try:
+                yield connection
+            finally:
+                try:
+                    connection.rollback()
+                    self.idle.put(connection)
+                except Exception:
+                    connection.close()
+        finally:
+            self.slots.release()
+
+    def close(self):
+        """
+        Closes the idle connections
+
+        Parameters
+        -----------
+
+        Returns
+        -------
+        int
+            number of connections closed
+        """
+        closed = 0
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return closed
+            closed += 1
+
 
 class DataBase(DataSource):
-    
-    def __init__(self):
+    """
+    Class to read tables and query results from databases, through a DB-API driver or a SQLAlchemy URL
+    """
+
+    def __init__(self, connection = None, pool_size = 5, batch_size = 10000):
         """
         Constructor.
-        
+
         Parameters
-        -----------       
-        arg : type
-              description
-        
+        -----------
+        connection : string or callable
+                     see open_connection
+
+        pool_size : int
+                    maximum number of connections open at once
+
+        batch_size : int
+                     number of rows fetched from the cursor at a time
+
         Returns
         -------
         class Object
         """
-        pass
-    
-    def get_data(self)->pd.DataFrame:
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.pool = None
+        self.engine = None
+        if connection is not None:
+            self.open_connection(connection)
+
+    def get_data(self, query, columns = None, params = None, chunksize = None, dtypes = None, where = None)->pd.DataFrame:
         """
-        Returns a flat table in Dataframe
-        
+        Returns a flat table in Dataframe. Rows are fetched in batches of batch_size rows, through a
+        server-side cursor when the database supports it, so chunked reads never hold the whole result.
+
         Parameters
-        -----------         
-        arg : type
-              description
-        
+        -----------
+        query : string
+                name of a table, or SELECT query with placeholders in the paramstyle of the driver
+                (named `:name` placeholders with a SQLAlchemy URL)
+
+        columns : list
+                  selected columns, only these are fetched from the database. If None returns all columns
+
+        params : tuple or dict
+                 values of the placeholders of the query, never formatted into the SQL string
+
+        chunksize : int
+                    if given, an iterator over DataFrames of chunksize rows is returned instead of a DataFrame
+
+        dtypes : dict
+                 dtype of some of the columns
+
+        where : string
+                SQL predicate filtering the rows in the database, with placeholders in the paramstyle of the driver
+
         Returns
         -------
-        pd.DataFrame    
-            Dataframe with data
+        pd.DataFrame or iterator
+            Dataframe with data, or iterator over chunks of it
         """
-        pass
-    
+        if self.pool is None and self.engine is None:
+            raise Exception('No connection. Call open_connection first.')
+        sql = self.select(query, columns, where)
+        if chunksize is not None:
+            return self._chunks(sql, params, chunksize, dtypes)
+        chunks = list(self._chunks(sql, params, self.batch_size, dtypes))
+        return pd.concat(chunks, ignore_index = True) if len(chunks) > 1 else chunks[0]
+
+    def select(self, query, columns = None, where = None):
+        """
+        SQL selecting the columns of a table or of the result of a query
+
+        Parameters
+        -----------
+        query : string
+                name of a table or SELECT query
+
+        columns : list
+                  selected columns, if None all columns
+
+        where : string
+                SQL predicate filtering the rows, with placeholders in the paramstyle of the driver
+
+        Returns
+        -------
+        string
+        """
+        if columns is None and where is None and not IDENTIFIER.match(query.strip()):
+            return query
+        projection = '*' if columns is None else ', '.join(quote(col) for col in columns)
+        return 'SELECT {} FROM {}{}'.format(projection, self._source(query), self._where([where]))
+
+    def aggregate(self, query, by, values = None, where = None, params = None, weights = None, dropna = True):
+        """
+        Group-by counts and sums computed by the database, only the aggregates are transferred
+
+        Parameters
+        -----------
+        query : string
+                name of a table or SELECT query
+
+        by : string or list
+             grouping columns
+
+        values : list
+                 columns summed in every group
+
+        where : string
+                SQL predicate filtering the rows before grouping
+
+        params : tuple or dict
+                 values of the placeholders of query and where
+
+        weights : string
+                  column with the frequency of every row, counts and sums are weighted by it
+
+        dropna : bool
+                 if rows with NULL in a grouping column are left out, as in pandas
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per group with the grouping columns, `count` and the sums of the values
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        values = list(values or [])
+        weight = '' if weights is None else '{} * '.format(quote(weights))
+        aggregates = ['COUNT(*)' if weights is None else 'SUM({})'.format(quote(weights))] + \
+                     ['SUM({}{})'.format(weight, quote(col)) for col in values]
+        keys = ', '.join(quote(col) for col in by)
+        conditions = [where] + (['{} IS NOT NULL'.format(quote(col)) for col in by] if dropna else [])
+        sql = 'SELECT {}, {} FROM {}{} GROUP BY {}'.format(keys, ', '.join(aggregates), self._source(query),
+                                                          self._where(conditions), keys)
+        df = self.get_data(sql, params = params)
+        df.columns = by + ['count'] + values
+        return df
+
+    def crosstab(self, query, row, col, where = None, params = None, weights = None):
+        """
+        Contingency table of two categorical columns counted by the database, in the layout of pd.crosstab.
+        It can be passed to Tester.categorical_test as data.
+
+        Parameters
+        -----------
+        query : string
+                name of a table or SELECT query
+
+        row, col : string
+                   categorical columns
+
+        where : string
+                SQL predicate filtering the rows
+
+        params : tuple or dict
+                 values of the placeholders of query and where
+
+        weights : string
+                  column with the frequency of every row
+
+        Returns
+        -------
+        pd.DataFrame
+            counts with one row per category of row and one column per category of col
+        """
+        counts = self.aggregate(query, [row, col], where = where, params = params, weights = weights)
+        return counts.pivot(index = row, columns = col, values = 'count').fillna(0)
+
+    def comoments(self, query, x, y, where = None, params = None, weights = None):
+        """
+        Means, variances and covariance of two quantitative columns computed by the database, over the rows
+        where both are not NULL. A first query computes the means and a second one the centered sums, which
+        keeps the precision of the two-pass formulas. The result can be passed to Tester.correlation_test.
+
+        Parameters
+        -----------
+        query : string
+                name of a table or SELECT query
+
+        x, y : string
+               quantitative columns
+
+        where : string
+                SQL predicate filtering the rows
+
+        params : tuple or dict
+                 values of the placeholders of query and where
+
+        weights : string
+                  column with the frequency of every row
+
+        Returns
+        -------
+        Comoments
+        """
+        x, y = quote(x), quote(y)
+        source = '{}{}'.format(self._source(query), self._where([where, '{} IS NOT NULL'.format(x), '{} IS NOT NULL'.format(y)]))
+        w = '1.0' if weights is None else '1.0 * {}'.format(quote(weights))
+        n, sum_x, sum_y = self.get_data('SELECT SUM({w}), SUM({w} * {x}), SUM({w} * {y}) FROM {source}'.format(
+            w = w, x = x, y = y, source = source), params = params).iloc[0]
+        comoments = Comoments()
+        if pd.isna(n) or not n:
+            return comoments
+        # the means come from the database itself, they are formatted as literals so that the placeholders of
+        # the query and of where keep their positions
+        mean_x, mean_y = repr(float(sum_x / n)), repr(float(sum_y / n))
+        sums = self.get_data('SELECT SUM({w} * ({x} - {mx}) * ({x} - {mx})), SUM({w} * ({y} - {my}) * ({y} - {my})), '
+                             'SUM({w} * ({x} - {mx}) * ({y} - {my})) FROM {source}'.format(
+                             w = w, x = x, y = y, mx = mean_x, my = mean_y, source = source), params = params).iloc[0]
+        comoments.n = int(n) if float(n).is_integer() else float(n)
+        comoments.mean_x, comoments.mean_y = float(sum_x / n), float(sum_y / n)
+        comoments.Cxx, comoments.Cyy, comoments.Cxy = (float(value) for value in sums)
+        return comoments
+
     def open_connection(self, connection):
         """
         Opens the connection to the database
-        
+
         Parameters
-        -----------         
-        connection : string
-                     Connection with database
-        
+        -----------
+        connection : string or callable
+                     SQLAlchemy URL (requires sqlalchemy), path of a SQLite file, or function without
+                     arguments returning a DB-API connection, e.g. lambda: duckdb.connect('file.db')
+
         Returns
         -------
         bool
             Check if connection is open or not
-            
+
         """
-        pass
-    
-    def close_connection(self, connection ):
+        self.close_connection()
+        if callable(connection):
+            self.pool = ConnectionPool(connection, self.pool_size)
+        elif '://' in connection:
+            if sqlalchemy is None:
+                raise Exception('Connecting to a URL requires sqlalchemy. Install it or pass a function returning a DB-API connection.')
+            self.engine = sqlalchemy.create_engine(connection, pool_size = self.pool_size)
+        else:
+            self.pool = ConnectionPool(lambda: sqlite3.connect(connection, check_same_thread = False), self.pool_size)
+        return True
+
+    def close_connection(self, connection = None):
         """
-        Close the connection database
-        
+        Close the connection database, closing every idle connection of the pool
+
         Parameters
-        -----------         
-        connection : string
-                     Connection with database
-        
+        -----------
+        connection : None
+                     kept for compatibility, the connections of the pool are closed
+
         Returns
         -------
         bool
             Check if connection was closed
-            
+
         """
-        pass
+        if self.pool is not None:
+            self.pool.close()
+        if self.engine is not None:
+            self.engine.dispose()
+        self.pool, self.engine = None, None
+        return True
+
+    def _source(self, query):
+        query = query.strip()
+        return quote(query) if IDENTIFIER.match(query) else '({}) AS source'.format(query.rstrip(';'))
+
+    def _where(self, conditions):
+        conditions = [condition for condition in conditions if condition]
+        return ' WHERE ' + ' AND '.join('({})'.format(condition) for condition in conditions) if conditions else ''
+
+    def _chunks(self, sql, params, chunksize, dtypes):
+        # the connection is borrowed until the iterator is exhausted or closed
+        for names, rows in self._batches(sql, params, chunksize):
+            df = pd.DataFrame.from_records(rows, columns = names)
+            yield df if not dtypes else df.astype(dtypes)
+
+    def _batches(self, sql, params, size):
+        if self.engine is not None:
+            with self.engine.connect() as connection:
+                result = connection.execution_options(stream_results = True, max_row_buffer = size) \
+                                   .execute(sqlalchemy.text(sql), params or {})
+                names = list(result.keys())
+                empty = True
+                for rows in result.partitions(size):
+                    empty = False
+                    yield names, [tuple(row) for row in rows]
+                if empty:
+                    yield names, []
+            return
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.arraysize = size
+                if params is None:
+                    cursor.execute(sql)
+                else:
+                    cursor.execute(sql, params)
+                names = [description[0] for description in cursor.description]
+                rows = cursor.fetchmany(size)
+                # an empty result is still returned as one empty batch, with its columns
+                yield names, rows
+                while len(rows) == size:
+                    rows = cursor.fetchmany(size)
+                    if rows:
+                        yield names, rows
+            finally:
+                cursor.close()
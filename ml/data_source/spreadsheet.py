@@ -1,30 +1,130 @@
 import pandas as pd
 
 from ml.data_source.base import DataSource
+from ml.data_source.columnar import ColumnarCache
 
 class Spreadsheet(DataSource):
     """
     Class to read files from spreadsheets or raw text files
     """
-    
-    def get_data(self, path, columns = None)->pd.DataFrame:
+
+    def __init__(self, cache_dir = None, cache_max_bytes = 2 ** 30, memory_map = False):
         """
-        Returns a flat table in Dataframe
-        
+        Constructor.
+
         Parameters
-        ----------            
-        arg : type
-              description
-  
-        columns : list 
+        ----------
+        cache_dir : string
+                    directory of the columnar cache of parsed files, if None every read parses the file
+
+        cache_max_bytes : int
+                          maximum total size of the cache
+
+        memory_map : bool
+                     if numerical columns are memory-mapped from the cache without copies (copy-on-write,
+                     changes stay in memory) instead of read into memory
+
+        Returns
+        -------
+        class Object
+        """
+        self.cache = None if cache_dir is None else ColumnarCache(cache_dir, cache_max_bytes, memory_map)
+
+    def get_data(self, path, columns = None, dtypes = None, categories = None, chunksize = None,
+                 sample_rows = 10000, **kwargs)->pd.DataFrame:
+        """
+        Returns a flat table in Dataframe. Only the selected columns are parsed, or read from the
+        columnar cache when the Spreadsheet has one.
+
+        Parameters
+        ----------
+        path : string
+              path of the file
+
+        columns : list
                   selected columns, if None returns all columns
-        
+
+        dtypes : dict
+                 dtype of some of the columns, the others are inferred by the reader
+
+        categories : float
+                     string columns whose number of distinct values is at most this share of the rows
+                     (estimated on the first sample_rows rows) are read as categorical. If None no column is
+                     converted
+
+        chunksize : int
+                    if given, an iterator over DataFrames of chunksize rows is returned instead of a DataFrame
+
+        sample_rows : int
+                      number of rows read to infer the categorical columns
+
+        kwargs :
+                 other arguments of pd.read_csv
+
+        Returns
+        -------
+        pd.DataFrame or iterator
+            Dataframe with data, or iterator over chunks of it
+        """
+        if self.cache is not None:
+            key = self.cache.key(path, {'dtypes': dtypes, 'categories': categories, 'sample_rows': sample_rows, **kwargs})
+            df = self.cache.get(key, columns)
+            # chunked reads are served from the cache but do not fill it, that would parse the whole file at once
+            if df is None and chunksize is None:
+                parsed = self._read(path, None, dtypes, categories, None, sample_rows, **kwargs)
+                self.cache.put(key, parsed, path)
+                # the entry may have been evicted right away when it is larger than the cache
+                df = self.cache.get(key, columns)
+                if df is None:
+                    df = parsed if columns is None else parsed[columns]
+            if df is not None:
+                if chunksize is None:
+                    return df
+                return (df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize))
+        return self._read(path, columns, dtypes, categories, chunksize, sample_rows, **kwargs)
+
+    def _read(self, path, columns, dtypes, categories, chunksize, sample_rows, **kwargs):
+        dtypes = dict(dtypes or {})
+        if categories is not None:
+            dtypes.update({col: 'category' for col in self.category_columns(path, columns, dtypes, categories,
+                                                                             sample_rows, **kwargs)})
+        if chunksize is not None:
+            return self._chunks(path, columns, dtypes, chunksize, **kwargs)
+        df = pd.read_csv(path, usecols = columns, dtype = dtypes or None, **kwargs)
+        return df if columns is None else df[columns]
+
+    def category_columns(self, path, columns = None, dtypes = None, categories = 0.5, sample_rows = 10000, **kwargs):
+        """
+        Finds the string columns with few distinct values on the first rows of the file
+
+        Parameters
+        ----------
+        path : string
+              path of the file
+
+        columns : list
+                  selected columns, if None all columns are considered
+
+        dtypes : dict
+                 columns with an explicit dtype, which are not considered
+
+        categories : float
+                     largest share of distinct values among the rows of the sample
+
+        sample_rows : int
+                      number of rows read
+
         Returns
         -------
-        pd.DataFrame
-            Dataframe with data
+        list
+            names of the columns
         """
-        if columns == None:
-          return pd.read_csv(path)
-        else:
-          return pd.read_csv(path)[columns]
+        sample = pd.read_csv(path, usecols = columns, nrows = sample_rows, **kwargs)
+        strings = sample.select_dtypes(include = ['object', 'string']).columns
+        return [col for col in strings if not col in (dtypes or {}) and
+                sample[col].nunique() <= categories * len(sample)]
+
+    def _chunks(self, path, columns, dtypes, chunksize, **kwargs):
+        with pd.read_csv(path, usecols = columns, dtype = dtypes or None, chunksize = chunksize, **kwargs) as reader:
+            for chunk in reader:
+                yield chunk if columns is None else chunk[columns]
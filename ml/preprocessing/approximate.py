@@ -0,0 +1,153 @@
+import numpy as np
+from scipy.stats import chi2, norm
+
+# variance of the Fisher z of each correlation coefficient relative to Pearson's 1 / (n - 3) (Fieller et al.)
+Z_VARIANCE = {'pearson': 1., 'spearman': 1.06, 'kendall': 0.437}
+
+
+def initial_size(precision, confidence = 0.99, variance = 1., minimum = 100):
+    """
+    Number of rows needed for a confidence interval of a correlation (or of Cohen's w) with half-width
+    precision around zero
+
+	Parameters
+	----------
+    precision : float
+              half-width of the confidence interval of the statistic
+    confidence : float
+              confidence level of the interval
+    variance : float
+              variance of the Fisher z relative to Pearson's, see Z_VARIANCE
+    minimum : int
+              smallest number of rows returned
+
+	Returns
+	-------
+    int
+    """
+    quantile = norm.isf((1 - confidence) / 2)
+    return max(int(np.ceil(variance * (quantile / precision) ** 2)) + 3, minimum)
+
+
+def growing_samples(n_rows, initial, growth = 4, seed = None):
+    """
+    Nested uniform samples (with replacement) of row positions, each growth times larger than the previous one.
+    Every sample extends the previous one, and the positions are sorted so that rows are read in storage order.
+    Stops before the samples reach half of the rows, when the exact test costs about as much.
+
+	Parameters
+	----------
+    n_rows : int
+              number of rows of the table
+    initial : int
+              size of the first sample
+    growth : int
+              ratio between the sizes of consecutive samples
+    seed : int
+              seed of the random number generator
+
+	Returns
+	-------
+    generator
+        sorted np.ndarray of row positions
+    """
+    rng = np.random.default_rng(seed)
+    positions = np.empty(0, dtype = np.int64)
+    size = initial
+    while size < n_rows / 2:
+        positions = np.sort(np.concatenate([positions, rng.integers(0, n_rows, size - len(positions))]))
+        yield positions
+        size *= growth
+
+
+def correlation_interval(r, n, method = 'pearson', confidence = 0.99):
+    """
+    Confidence interval of a correlation coefficient estimated on n rows, from the normal approximation of its Fisher z
+
+	Parameters
+	----------
+    r : float
+              correlation coefficient
+    n : int
+              number of rows of the sample
+    method : string
+              one of `pearson`, `spearman` or `kendall`
+    confidence : float
+              confidence level of the interval
+
+	Returns
+	-------
+    tuple
+        (lower, upper)
+    """
+    width = norm.isf((1 - confidence) / 2) * np.sqrt(Z_VARIANCE[method] / (n - 3))
+    z = np.arctanh(np.clip(r, -1 + 1e-15, 1 - 1e-15))
+    return float(np.tanh(z - width)), float(np.tanh(z + width))
+
+
+def effect_interval(statistic, n, dof, confidence = 0.99):
+    """
+    Estimate and confidence interval of the squared Cohen's w (chi-squared statistic per row) of a contingency
+    table, from the normal approximation of the noncentral chi-squared distribution of the statistic
+
+	Parameters
+	----------
+    statistic : float
+              chi-squared statistic without continuity correction computed on the sample
+    n : int
+              number of rows of the sample
+    dof : int
+              degrees of freedom of the table
+    confidence : float
+              confidence level of the interval
+
+	Returns
+	-------
+    tuple
+        (estimate, lower, upper)
+    """
+    noncentrality = max(statistic - dof, 0.)
+    width = norm.isf((1 - confidence) / 2) * np.sqrt(2 * (dof + 2 * noncentrality))
+    return noncentrality / n, max(noncentrality - width, 0.) / n, (noncentrality + width) / n
+
+
+def chi2_p_values(w2, n_rows, dof):
+    """
+    p-values the chi-squared test would have on n_rows rows for squared Cohen's w effects
+
+	Parameters
+	----------
+    w2 : array_like
+              squared Cohen's w
+    n_rows : int
+              number of rows of the full table
+    dof : int
+              degrees of freedom of the table
+
+	Returns
+	-------
+    np.ndarray
+    """
+    return chi2.sf(np.asarray(w2) * n_rows, dof)
+
+
+def p_value_range(lower, upper, p_values):
+    """
+    Smallest and largest p-values over a confidence interval of a statistic. The p-value is monotone on each
+    side of zero, so it is evaluated at the bounds and at zero when the interval contains it.
+
+	Parameters
+	----------
+    lower, upper : float
+              bounds of the interval
+    p_values : callable
+              function mapping an array of statistics to p-values
+
+	Returns
+	-------
+    tuple
+        (smallest p-value, largest p-value)
+    """
+    points = [lower, upper] + ([0.] if lower < 0 < upper else [])
+    p = p_values(np.array(points))
+    return float(p.min()), float(p.max())
@@ -0,0 +1,246 @@
+from collections import OrderedDict
+from functools import partial, wraps
+import hashlib
+import inspect
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from ml.preprocessing.contingency import ContingencyTable
+from ml.preprocessing.results import ResultSet, TestResult
+from ml.preprocessing.streaming import Comoments
+
+
+def fingerprint(*values):
+    """
+    Fast content hash of the arguments of a call. Numerical arrays are hashed straight from their
+    memory buffers, object arrays through pandas' vectorized hashing.
+
+	Parameters
+	----------
+    values : objects
+              arrays, Series, DataFrames, contingency tables, co-moments or any object with a stable repr
+
+	Returns
+	-------
+    string
+    """
+    hasher = hashlib.blake2b(digest_size = 16)
+    for value in values:
+        _update(hasher, value)
+    return hasher.hexdigest()
+
+
+def _update(hasher, value):
+    if isinstance(value, pd.DataFrame):
+        hasher.update(b'DataFrame' + repr(list(value.columns)).encode())
+        _update(hasher, value.index)
+        for i in range(value.shape[1]):
+            _update(hasher, value.iloc[:, i].to_numpy())
+    elif isinstance(value, pd.Series):
+        hasher.update(b'Series' + repr(value.name).encode())
+        _update(hasher, value.index)
+        _update(hasher, value.to_numpy())
+    elif isinstance(value, pd.RangeIndex):
+        hasher.update(repr(value).encode())
+    elif isinstance(value, pd.Index):
+        hasher.update(b'Index' + repr(list(value.names)).encode())
+        _update(hasher, pd.util.hash_pandas_object(value, index = False).to_numpy())
+    elif isinstance(value, np.ndarray):
+        hasher.update(('ndarray' + value.dtype.str + repr(value.shape)).encode())
+        if value.dtype.hasobject:
+            value = pd.util.hash_array(value.ravel())
+        hasher.update(memoryview(np.ascontiguousarray(value)).cast('B'))
+    elif isinstance(value, ContingencyTable):
+        hasher.update(b'ContingencyTable' + repr(value.shape).encode())
+        for part in (value.observed.data, value.observed.indices, value.observed.indptr, value.rows, value.cols):
+            _update(hasher, part)
+    elif isinstance(value, Comoments):
+        hasher.update(b'Comoments' + repr((value.n, value.mean_x, value.mean_y, value.Cxx, value.Cyy, value.Cxy)).encode())
+    elif isinstance(value, (list, tuple)) and len(value) > 16:
+        _update(hasher, np.asarray(value))
+    else:
+        hasher.update(repr(value).encode())
+
+
+class ResultCache:
+    """
+    Two-tier cache of test results: an in-memory LRU tier and an optional on-disk tier of pickled results
+    whose total size is bounded by evicting the least recently used files.
+    """
+
+    def __init__(self, size = 128, directory = None, max_bytes = 2 ** 30):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        size : int
+                  number of results kept in memory
+        directory : string
+                  directory of the on-disk tier, if None results are only kept in memory
+        max_bytes : int
+                  maximum total size of the on-disk tier
+
+    	Returns
+    	-------
+        ResultCache
+        """
+        self.size = size
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.hits, self.misses = 0, 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok = True)
+
+    def get(self, key):
+        """
+        Returns the cached result for key, or None
+
+    	Parameters
+    	----------
+        key : string
+                  fingerprint of the call
+
+    	Returns
+    	-------
+        object
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+        if self.directory is not None:
+            path = os.path.join(self.directory, key + '.pkl')
+            try:
+                with open(path, 'rb') as file:
+                    result = pickle.load(file)
+                os.utime(path)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                result = None
+            if result is not None:
+                self.hits += 1
+                self._remember(key, result)
+                return result
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """
+        Stores result for key in memory and, if enabled, on disk
+
+    	Parameters
+    	----------
+        key : string
+                  fingerprint of the call
+        result : object
+                  result of the call
+
+    	Returns
+    	-------
+        None
+        """
+        self._remember(key, result)
+        if self.directory is not None:
+            path = os.path.join(self.directory, key + '.pkl')
+            with open(path + '.tmp', 'wb') as file:
+                pickle.dump(result, file, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+            self._evict()
+
+    def clear(self):
+        """
+        Removes every cached result from both tiers
+        """
+        self.memory.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def _remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.size:
+            self.memory.popitem(last = False)
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def cached(method = None, frame = None, columns = ()):
+    """
+    Decorator of Tester methods: when the Tester has a cache, results are looked up by a fingerprint
+    of the method name, the output settings of the Tester and all the arguments before calling the method.
+    Cached DataFrames and result objects are returned as copies so callers cannot modify the stored result.
+    Used as @cached(frame = ..., columns = ...) on methods reading some columns of a DataFrame argument,
+    only the columns named by those arguments are hashed.
+
+	Parameters
+	----------
+    method : callable
+              Tester method
+    frame : string
+              name of the DataFrame argument
+    columns : tuple
+              names of the arguments holding the column names, or lists of them, read from frame.
+              When none of them is given the whole frame is hashed
+
+	Returns
+	-------
+    callable
+    """
+    if method is None:
+        return partial(cached, frame = frame, columns = columns)
+    parameters = list(inspect.signature(method).parameters.values())[1:]
+    positions = {parameter.name: i for i, parameter in enumerate(parameters)}
+
+    def argument(args, kwargs, name):
+        i = positions[name]
+        return args[i] if i < len(args) else kwargs.get(name, parameters[i].default)
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+        hashed_args, hashed_kwargs = args, kwargs
+        if frame is not None:
+            df, names = argument(args, kwargs, frame), []
+            for name in columns:
+                value = argument(args, kwargs, name)
+                if isinstance(value, str):
+                    names.append(value)
+                elif isinstance(value, list):
+                    names += value
+            if isinstance(df, pd.DataFrame) and names and all(name in df.columns for name in names):
+                df = df[list(dict.fromkeys(names))]
+                if positions[frame] < len(args):
+                    hashed_args = args[:positions[frame]] + (df,) + args[positions[frame] + 1:]
+                else:
+                    hashed_kwargs = {**kwargs, frame: df}
+        # the settings of the Tester change the type of the result, a cache may be shared between Testers
+        key = fingerprint(method.__name__, self.lightweight, self.verbose, len(hashed_args), *hashed_args,
+                          sorted(hashed_kwargs), *[hashed_kwargs[k] for k in sorted(hashed_kwargs)])
+        result = self.cache.get(key)
+        if result is None:
+            self._count('cache miss')
+            result = method(self, *args, **kwargs)
+            self.cache.put(key, result)
+        else:
+            self._count('cache hit')
+        return result.copy() if isinstance(result, (pd.DataFrame, ResultSet, TestResult)) else result
+    return wrapper
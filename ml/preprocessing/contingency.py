@@ -0,0 +1,521 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.special import gammaln
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import chi2
+from ml.preprocessing.resampling import run_blocks
+
+_log_factorials = np.zeros(1)
+
+
+class ContingencyTable:
+    """
+    Contingency table of two categorical samples, stored sparse so that only the observed
+    combinations of categories take memory. Every statistic is computed from this one table.
+    """
+
+    def __init__(self, observed, rows = None, cols = None):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        observed : array_like or scipy.sparse matrix
+                  counts of every combination of categories
+        rows, cols : array_like
+                  labels of the categories of each sample
+
+    	Returns
+    	-------
+        ContingencyTable
+        """
+        self.observed = sparse.csr_matrix(observed, dtype = np.float64)
+        self.observed.eliminate_zeros()
+        self.rows = np.arange(self.observed.shape[0]) if rows is None else np.asarray(rows)
+        self.cols = np.arange(self.observed.shape[1]) if cols is None else np.asarray(cols)
+        self.row_totals = np.asarray(self.observed.sum(axis = 1)).ravel()
+        self.col_totals = np.asarray(self.observed.sum(axis = 0)).ravel()
+        self.n = self.row_totals.sum()
+
+    @classmethod
+    def from_samples(cls, sample1, sample2, weights = None):
+        """
+        Builds the table from two aligned categorical samples by counting their combined integer codes once.
+        Pairs where any of the samples is missing are ignored.
+
+    	Parameters
+    	----------
+        sample1, sample2 : array_like
+                  Arrays of categorical sample data.
+        weights : array_like
+                  frequency of every pair, for pre-aggregated samples. If None every pair counts once
+
+    	Returns
+    	-------
+        ContingencyTable
+        """
+        codes1, rows = pd.factorize(np.asarray(sample1), sort = True)
+        codes2, cols = pd.factorize(np.asarray(sample2), sort = True)
+        return cls.from_codes(codes1, codes2, rows, cols, weights)
+
+    @classmethod
+    def from_codes(cls, codes1, codes2, rows, cols, weights = None):
+        """
+        Builds the table from two aligned arrays of integer codes, where -1 marks a missing value.
+        Categories that do not occur in any complete pair are dropped.
+
+    	Parameters
+    	----------
+        codes1, codes2 : np.ndarray
+                  Arrays of integer codes of the categories.
+        rows, cols : array_like
+                  labels of the categories of each sample, indexed by code
+        weights : array_like
+                  frequency of every pair, if None every pair counts once
+
+    	Returns
+    	-------
+        ContingencyTable
+        """
+        rows, cols = np.asarray(rows), np.asarray(cols)
+        valid = (codes1 >= 0) & (codes2 >= 0)
+        if weights is not None:
+            weights = np.asarray(weights, dtype = np.float64)
+            if (weights < 0).any():
+                raise Exception('Frequency weights must not be negative.')
+            valid &= weights > 0
+        if not valid.all():
+            codes1, codes2 = codes1[valid], codes2[valid]
+            weights = None if weights is None else weights[valid]
+        combined = codes1.astype(np.int64) * len(cols) + codes2
+        if len(rows) * len(cols) <= 4 * len(combined) + 1024:
+            counts = np.bincount(combined, weights = weights, minlength = len(rows) * len(cols))
+            cells = np.flatnonzero(counts)
+            counts = counts[cells]
+        elif weights is None:
+            cells, counts = np.unique(combined, return_counts = True)
+        else:
+            cells, inverse = np.unique(combined, return_inverse = True)
+            counts = np.bincount(inverse, weights = weights)
+        used_rows, cell_rows = np.unique(cells // len(cols), return_inverse = True)
+        used_cols, cell_cols = np.unique(cells % len(cols), return_inverse = True)
+        observed = sparse.csr_matrix((counts, (cell_rows, cell_cols)), shape = (len(used_rows), len(used_cols)))
+        return cls(observed, rows[used_rows], cols[used_cols])
+
+    @classmethod
+    def from_frame(cls, table):
+        """
+        Builds the table from pre-aggregated counts, such as the output of pd.crosstab. Categories without
+        any count are dropped.
+
+    	Parameters
+    	----------
+        table : pd.DataFrame or array_like
+                  counts with one row per category of the first sample and one column per category of the second
+
+    	Returns
+    	-------
+        ContingencyTable
+        """
+        table = pd.DataFrame(table)
+        counts = table.to_numpy(dtype = np.float64)
+        if np.isnan(counts).any() or (counts < 0).any():
+            raise Exception('Counts must be non-negative numbers.')
+        used_rows, used_cols = counts.sum(axis = 1) > 0, counts.sum(axis = 0) > 0
+        return cls(counts[used_rows][:, used_cols], table.index[used_rows], table.columns[used_cols])
+
+    @property
+    def shape(self):
+        return self.observed.shape
+
+    @property
+    def dof(self):
+        return (self.shape[0] - 1) * (self.shape[1] - 1)
+
+    def expected_nonzero(self):
+        """
+        Expected counts of the cells with nonzero observed counts, in the order of self.observed.data
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        np.ndarray
+        """
+        coo = self.observed.tocoo()
+        return self.row_totals[coo.row] * self.col_totals[coo.col] / self.n
+
+    def expected_below(self, threshold = 5):
+        """
+        Counts the cells, observed or not, whose expected count is below threshold,
+        without building the dense expected table
+
+    	Parameters
+    	----------
+        threshold : float
+                  minimum expected count
+
+    	Returns
+    	-------
+        int
+        """
+        col_totals = np.sort(self.col_totals)
+        limits = threshold * self.n / self.row_totals
+        return int(np.searchsorted(col_totals, limits, side = 'left').sum())
+
+    def chi2(self, correction = True):
+        """
+        Pearson chi-squared test of independence. Yates' correction is applied when there is one degree of freedom.
+
+    	Parameters
+    	----------
+        correction : bool
+                  if Yates' correction should be applied to tables with one degree of freedom
+
+    	Returns
+    	-------
+        tuple
+            (statistic, p-value)
+        """
+        if correction and self.dof == 1:
+            observed, expected = self._corrected()
+            statistic = ((observed - expected) ** 2 / expected).sum()
+        else:
+            statistic = (self.observed.data ** 2 / self.expected_nonzero()).sum() - self.n
+            statistic = max(statistic, 0.)
+        return statistic, chi2.sf(statistic, self.dof)
+
+    def g_test(self, correction = True):
+        """
+        Log-likelihood ratio (G) test of independence. Yates' correction is applied when there is one degree of freedom.
+
+    	Parameters
+    	----------
+        correction : bool
+                  if Yates' correction should be applied to tables with one degree of freedom
+
+    	Returns
+    	-------
+        tuple
+            (statistic, p-value)
+        """
+        if correction and self.dof == 1:
+            observed, expected = self._corrected()
+            observed, expected = observed[observed > 0], expected[observed > 0]
+        else:
+            observed, expected = self.observed.data, self.expected_nonzero()
+        statistic = 2 * (observed * np.log(observed / expected)).sum()
+        return statistic, chi2.sf(statistic, self.dof)
+
+    def _corrected(self):
+        """
+        Dense observed counts moved 0.5 towards the expected counts (Yates' correction) and dense expected counts
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        tuple
+            (observed, expected)
+        """
+        observed = self.observed.toarray()
+        expected = np.outer(self.row_totals, self.col_totals) / self.n
+        diff = expected - observed
+        return observed + np.sign(diff) * np.minimum(0.5, np.abs(diff)), expected
+
+    def cramer_v(self, statistic):
+        """
+        Cramér's V effect size for a chi-squared statistic computed on this table
+
+    	Parameters
+    	----------
+        statistic : float
+                  chi-squared statistic
+
+    	Returns
+    	-------
+        float
+        """
+        k = min(self.shape) - 1
+        return np.sqrt(statistic / (self.n * k)) if k > 0 else np.nan
+
+    def to_frame(self):
+        """
+        Dense observed table, only meant for display of small tables
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        pd.DataFrame
+        """
+        return pd.DataFrame(self.observed.toarray(), index = self.rows, columns = self.cols)
+
+    def expected_frame(self):
+        """
+        Dense expected table, only meant for display of small tables
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        pd.DataFrame
+        """
+        return pd.DataFrame(np.outer(self.row_totals, self.col_totals) / self.n, index = self.rows, columns = self.cols)
+
+
+
+def log_factorials(n):
+    """
+    Returns the table of log(k!) for k = 0..n, extending the cached table when needed
+
+	Parameters
+	----------
+    n : int
+              largest k needed
+
+	Returns
+	-------
+    np.ndarray
+    """
+    global _log_factorials
+    if len(_log_factorials) <= n:
+        _log_factorials = gammaln(np.arange(max(n + 1, 2 * len(_log_factorials))) + 1)
+    return _log_factorials
+
+
+def fisher_exact_batch(tables, alternative = 'two-sided', max_elements = 2 ** 24):
+    """
+    Fisher exact test for a batch of 2x2 contingency tables. The hypergeometric probabilities of every
+    table are evaluated together from a cached table of log-factorials, in blocks of at most
+    max_elements probabilities. Gives the same results as scipy.stats.fisher_exact table by table.
+
+	Parameters
+	----------
+    tables : array_like
+              counts with shape (n, 2, 2)
+    alternative : string
+              alternative hypothesis, one of `two-sided`, `less` or `greater`
+    max_elements : int
+              maximum number of probabilities held in memory at once
+
+	Returns
+	-------
+    tuple
+        (odds ratios, p-values), arrays of length n
+    """
+    if not alternative in ('two-sided', 'less', 'greater'):
+        raise Exception('Invalid alternative. Choose one of `two-sided`, `less` or `greater`.')
+    tables = np.asarray(tables, dtype = np.int64).reshape(-1, 2, 2)
+    if (tables < 0).any():
+        raise Exception('Counts must be non-negative.')
+    a, b, c, d = tables[:, 0, 0], tables[:, 0, 1], tables[:, 1, 0], tables[:, 1, 1]
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        odds_ratios = (a * d).astype(np.float64) / (b * c)
+    row1, row2, col1 = a + b, c + d, a + c
+    n = row1 + row2
+    low, high = np.maximum(0, col1 - row2), np.minimum(row1, col1)
+    p_values = np.ones(len(tables))
+    degenerate = (row1 == 0) | (row2 == 0) | (col1 == 0) | (col1 == n)
+    odds_ratios[degenerate] = np.nan
+    lf = log_factorials(int(n.max()) if len(n) else 0)
+
+    widths = high - low + 1
+    order = np.argsort(widths, kind = 'stable')
+    order = order[~degenerate[order]]
+    # tables are sorted by width, so a block of tables start to i fits in max_elements when
+    # (i + 1 - start) * widths[i] <= max_elements, that is start >= limits[i], with limits increasing in i
+    limits = np.arange(1, len(order) + 1) - max_elements // widths[order]
+    start = 0
+    while start < len(order):
+        stop = max(start + 1, int(np.searchsorted(limits, start, side = 'right')))
+        block = order[start:stop]
+        width = int(widths[order[stop - 1]])
+        x = low[block, None] + np.arange(width)
+        inside = x <= high[block, None]
+        x = np.where(inside, x, low[block, None])
+        r1, r2, c1 = row1[block, None], row2[block, None], col1[block, None]
+        constant = lf[r1] + lf[r2] + lf[c1] + lf[n[block, None] - c1] - lf[n[block, None]]
+        log_pmf = constant - lf[x] - lf[r1 - x] - lf[c1 - x] - lf[r2 - c1 + x]
+        log_pmf = np.where(inside, log_pmf, -np.inf)
+        observed = a[block, None]
+        if alternative == 'less':
+            selected = x <= observed
+        elif alternative == 'greater':
+            selected = x >= observed
+        else:
+            observed_log_pmf = np.take_along_axis(log_pmf, observed - low[block, None], axis = 1)
+            selected = log_pmf <= observed_log_pmf + np.log1p(1e-7)
+        p_values[block] = np.minimum(np.where(inside & selected, np.exp(log_pmf), 0).sum(axis = 1), 1)
+        start = stop
+    return odds_ratios, p_values
+
+def random_tables(row_totals, col_totals, size, rng):
+    """
+    Random contingency tables with the given margins, drawn uniformly among the tables with these margins
+    under independence (the multiple hypergeometric distribution). Every cell is drawn from the hypergeometric
+    distribution conditional on the cells already filled, as in Patefield's algorithm, for all the tables at once.
+
+	Parameters
+	----------
+    row_totals, col_totals : np.ndarray
+              integer margins of the tables
+    size : int
+              number of tables
+    rng : np.random.Generator
+              random number generator
+
+	Returns
+	-------
+    np.ndarray
+        counts with shape (size, rows, columns)
+    """
+    r, c = len(row_totals), len(col_totals)
+    tables = np.zeros((size, r, c), dtype = np.int64)
+    col_left = np.tile(np.asarray(col_totals, dtype = np.int64), (size, 1))
+    for i in range(r - 1):
+        row_left = np.full(size, row_totals[i], dtype = np.int64)
+        later = col_left.sum(axis = 1)
+        for j in range(c - 1):
+            later = later - col_left[:, j]
+            cell = rng.hypergeometric(col_left[:, j], later, row_left)
+            tables[:, i, j] = cell
+            col_left[:, j] -= cell
+            row_left -= cell
+        tables[:, i, c - 1] = row_left
+        col_left[:, c - 1] -= row_left
+    tables[:, r - 1] = col_left
+    return tables
+
+
+def simulated_exceedances(row_totals, col_totals, value, seeds, blocks):
+    """
+    Counts the random tables whose Pearson chi-squared statistic is at least value, block by block
+
+	Parameters
+	----------
+    row_totals, col_totals : np.ndarray
+              integer margins of the tables
+    value : float
+              observed statistic
+    seeds : list
+              one np.random.SeedSequence per block
+    blocks : list
+              number of tables of each block
+
+	Returns
+	-------
+    int
+    """
+    n = row_totals.sum()
+    expected = np.outer(row_totals, col_totals) / n
+    count = 0
+    for seed, block in zip(seeds, blocks):
+        tables = random_tables(row_totals, col_totals, block, np.random.default_rng(seed))
+        statistics = (tables ** 2 / expected).sum(axis = (1, 2)) - n
+        count += int((statistics >= value - 1e-9 * max(value, 1.)).sum())
+    return count
+
+
+def monte_carlo_chi2(table, n_resamples = 10000, alpha = 0.05, seed = None, early_stop = True, confidence = 0.999,
+                     memory_budget = 2 ** 27, n_jobs = 1):
+    """
+    Monte Carlo exact test of independence of an r x c table: the p-value is the share of random tables with
+    the same margins whose Pearson chi-squared statistic is at least the observed one. It stays valid when
+    expected counts are small. Tables are drawn in blocks of at most 1000 tables that fit in memory_budget bytes.
+    Block i always uses the i-th child of the seed and early stopping is checked block by block in order
+    (see resampling.run_blocks), so results do not depend on n_jobs.
+
+	Parameters
+	----------
+    table : ContingencyTable
+              table of integer counts
+    n_resamples : int
+              maximum number of random tables
+    alpha : float
+              level of significance used for early stopping
+    seed : int
+              seed of the random number generator
+    early_stop : bool
+              if the simulation stops once a Clopper-Pearson interval of the p-value excludes alpha
+    confidence : float
+              confidence of the interval used for early stopping
+    memory_budget : int
+              approximate number of bytes used by a block of tables
+    n_jobs : int
+              number of processes simulating blocks
+
+	Returns
+	-------
+    tuple
+        (statistic, p-value, number of tables simulated)
+    """
+    row_totals, col_totals = np.rint(table.row_totals).astype(np.int64), np.rint(table.col_totals).astype(np.int64)
+    if not np.allclose(table.observed.data, np.rint(table.observed.data)):
+        raise Exception('The Monte Carlo test requires integer counts.')
+    value = table.chi2(correction = False)[0]
+    block = int(max(1, min(n_resamples, 1000, memory_budget // (24 * table.shape[0] * table.shape[1]))))
+    blocks = [block] * (n_resamples // block) + ([n_resamples % block] if n_resamples % block else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+    executor = ProcessPoolExecutor(max_workers = n_jobs) if n_jobs > 1 else None
+    try:
+        count, done = run_blocks(simulated_exceedances, (row_totals, col_totals, value), seeds, blocks, alpha,
+                                 early_stop, confidence, executor, n_jobs)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures = True)
+    return value, (count + 1) / (done + 1), done
+
+
+def _attach_codes(name, shape, dtype, labels):
+    """
+    Process pool initializer: attaches the shared matrix of integer codes used by _screen_pairs
+    """
+    global _shared_memory, _shared_codes, _shared_labels
+    from multiprocessing import shared_memory
+    _shared_memory = shared_memory.SharedMemory(name = name)
+    _shared_codes = np.ndarray(shape, dtype = dtype, buffer = _shared_memory.buf, order = 'F')
+    _shared_labels = labels
+
+
+def _screen_pairs(pairs, codes = None, labels = None):
+    """
+    Tests the independence of each pair of columns of the matrix of integer codes, with Fisher exact
+    for 2x2 tables and Pearson chi-squared otherwise
+
+	Parameters
+	----------
+        pairs : list
+                  pairs of column positions
+        codes : np.ndarray
+                  matrix of integer codes, one column per variable. If None the shared matrix is used
+        labels : list
+                  labels of the categories of each column, indexed by code
+
+	Returns
+	-------
+        list
+            (test, statistic, p-value, number of cells with expected count below 5) for each pair
+    """
+    if codes is None:
+        codes, labels = _shared_codes, _shared_labels
+    results, fisher_positions, fisher_tables = [], [], []
+    for i, j in pairs:
+        table = ContingencyTable.from_codes(codes[:, i], codes[:, j], labels[i], labels[j])
+        if table.shape == (2, 2):
+            fisher_positions.append(len(results))
+            fisher_tables.append(table.observed.toarray())
+            results.append(['fisher exact', np.nan, np.nan, table.expected_below(5)])
+        else:
+            statistic, p_value = table.chi2()
+            results.append(['pearson chi-squared', statistic, p_value, table.expected_below(5)])
+    if fisher_tables:
+        odds_ratios, p_values = fisher_exact_batch(np.array(fisher_tables))
+        for position, odds_ratio, p_value in zip(fisher_positions, odds_ratios, p_values):
+            results[position][1], results[position][2] = odds_ratio, p_value
+    return [tuple(result) for result in results]
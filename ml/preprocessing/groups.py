@@ -0,0 +1,172 @@
+import numpy as np
+from scipy.stats import chi2, f, norm, rankdata, shapiro
+from scipy.stats import t as t_dist
+from ml.preprocessing.streaming import dagostino
+
+METHODS = {'ttest': 'welch t-test', 'mannwhitney': 'mann-whitney u', 'anova': 'one-way anova', 'kruskal': 'kruskal-wallis h'}
+
+
+def grouped_sums(values, codes, n_groups):
+    """
+    Sums of every column of values within each group, computed with a single bincount
+
+	Parameters
+	----------
+    values : np.ndarray
+              2-D array of sample data, one metric per column
+    codes : np.ndarray
+              group code of every row, from 0 to n_groups - 1
+    n_groups : int
+              number of groups
+
+	Returns
+	-------
+    np.ndarray
+        array of shape (n_groups, number of columns)
+    """
+    k = values.shape[1]
+    cells = (codes[:, None] + n_groups * np.arange(k)).ravel()
+    return np.bincount(cells, weights = values.ravel(), minlength = n_groups * k).reshape(k, n_groups).T
+
+
+def tie_term(ranks):
+    """
+    Sum of t^3 - t over the groups of tied values of every column, used by the rank test tie corrections
+
+	Parameters
+	----------
+    ranks : np.ndarray
+              2-D array of ranks (average method), one column per metric
+
+	Returns
+	-------
+    np.ndarray
+    """
+    ordered = np.sort(ranks, axis = 0)
+    terms = np.zeros(ranks.shape[1])
+    for j in range(ranks.shape[1]):
+        starts = np.flatnonzero(np.diff(ordered[:, j], prepend = np.nan, append = np.nan) != 0)
+        ties = np.diff(starts).astype(np.float64)
+        terms[j] = (ties ** 3 - ties).sum()
+    return terms
+
+
+def group_tests(values, codes, n_groups, method = None, alternative = 'two-sided', max_shapiro = 5000):
+    """
+    Compares every column of values between the groups. Group sizes, moments and ranks are computed
+    for all columns at once. If method is None, each column gets a parametric test (Welch t-test for two
+    groups, one-way ANOVA otherwise) when normality is not rejected at 0.05 in any group, and a rank test
+    (Mann-Whitney U with normal approximation for two groups, Kruskal-Wallis H otherwise) when it is. As in
+    the rest of the Tester, Shapiro-Wilk is applied to groups of at most max_shapiro observations and the
+    D'Agostino K² test, from the grouped moments, to larger ones.
+
+	Parameters
+	----------
+    values : np.ndarray
+              2-D array of sample data, one metric per column. Missing values (NaN) are left out column by column
+    codes : np.ndarray
+              group code of every row, from 0 to n_groups - 1
+    n_groups : int
+              number of groups, at least 2
+    method : string
+              one of `ttest`, `mannwhitney`, `anova` or `kruskal`, if None it is chosen per column
+    alternative : string
+              one of `two-sided`, `greater` or `less`, comparing the first group with the second.
+              Only used with two groups
+    max_shapiro : int
+              largest group tested with Shapiro-Wilk
+
+	Returns
+	-------
+    tuple
+        (test applied, statistic, p-value), one value per column
+    """
+    if n_groups < 2:
+        raise Exception('At least two groups are needed.')
+    if method is not None and not method in METHODS:
+        raise Exception('Invalid method. Choose one of `ttest`, `mannwhitney`, `anova` or `kruskal`.')
+    if n_groups > 2 and method in ('ttest', 'mannwhitney'):
+        raise Exception('{} compares two groups, use `anova` or `kruskal` instead.'.format(method))
+    two = n_groups == 2 and not method in ('anova', 'kruskal')
+    if not two and alternative != 'two-sided':
+        raise Exception('Only the `two-sided` alternative is available for `anova` and `kruskal`.')
+    # missing values are left out column by column: they get zero weight in every grouped sum
+    observed = ~np.isnan(values)
+    values = np.where(observed, values, 0.)
+    n = observed.sum(axis = 0).astype(np.float64)
+    k = values.shape[1]
+    sizes = grouped_sums(observed.astype(np.float64), codes, n_groups)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        means = grouped_sums(values, codes, n_groups) / sizes
+    centered = np.where(observed, values - means[codes], 0.)
+    squared = centered ** 2
+    M2 = grouped_sums(squared, codes, n_groups)
+
+    if method is None:
+        small = sizes <= max_shapiro
+        counts = np.where(small, 8, sizes)
+        p_normal = dagostino(counts, M2, grouped_sums(squared * centered, codes, n_groups),
+                             grouped_sums(squared ** 2, codes, n_groups))[1]
+        for g, j in zip(*np.nonzero(small)):
+            group_values = values[(codes == g) & observed[:, j], j]
+            p_normal[g, j] = shapiro(group_values)[1] if len(group_values) >= 3 else 1.
+        parametric = (p_normal >= 0.05).all(axis = 0)
+    else:
+        parametric = np.full(k, method in ('ttest', 'anova'))
+
+    statistic, p_values = np.full(k, np.nan), np.full(k, np.nan)
+    if parametric.any():
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            variances = M2 / (sizes - 1)
+        if two:
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                se2 = variances / sizes
+                t = (means[0] - means[1]) / np.sqrt(se2.sum(axis = 0))
+                dof = se2.sum(axis = 0) ** 2 / (se2 ** 2 / (sizes - 1)).sum(axis = 0)
+            p = _tail(t, alternative, lambda z: t_dist.sf(z, dof), lambda z: t_dist.cdf(z, dof))
+        else:
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                grand = values.sum(axis = 0) / n
+                between = (sizes * (means - grand) ** 2).sum(axis = 0)
+                within = M2.sum(axis = 0)
+                t = (between / (n_groups - 1)) / (within / (n - n_groups))
+            p = f.sf(t, n_groups - 1, n - n_groups)
+        statistic[parametric], p_values[parametric] = t[parametric], p[parametric]
+    if not parametric.all():
+        rank_columns = np.flatnonzero(~parametric)
+        n_rank, sizes_rank = n[rank_columns], sizes[:, rank_columns]
+        ranks = rankdata(np.where(observed, values, np.nan)[:, rank_columns], axis = 0, nan_policy = 'omit')
+        # a missing value is its own group of ties, it adds nothing to the tie term
+        ties = tie_term(ranks)
+        rank_sums = grouped_sums(np.nan_to_num(ranks), codes, n_groups)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            if two:
+                n1, n2 = sizes_rank
+                u = rank_sums[0] - n1 * (n1 + 1) / 2
+                mu = n1 * n2 / 2
+                sigma = np.sqrt(n1 * n2 / 12 * ((n_rank + 1) - ties / (n_rank * (n_rank - 1))))
+                if alternative == 'two-sided':
+                    p = np.minimum(2 * norm.sf((np.abs(u - mu) - 0.5) / sigma), 1)
+                else:
+                    p = _tail(u - mu, alternative, lambda z: norm.sf((z - 0.5) / sigma), lambda z: norm.cdf((z + 0.5) / sigma))
+            else:
+                h = 12 / (n_rank * (n_rank + 1)) * (rank_sums ** 2 / sizes_rank).sum(axis = 0) - 3 * (n_rank + 1)
+                u = h / (1 - ties / (n_rank ** 3 - n_rank))
+                p = chi2.sf(u, n_groups - 1)
+        statistic[rank_columns], p_values[rank_columns] = u, p
+
+    if two:
+        methods = np.where(parametric, METHODS['ttest'], METHODS['mannwhitney'])
+    else:
+        methods = np.where(parametric, METHODS['anova'], METHODS['kruskal'])
+    return methods.astype(object), statistic, p_values
+
+
+def _tail(statistic, alternative, upper, lower):
+    if alternative == 'two-sided':
+        return np.minimum(2 * upper(np.abs(statistic)), 1)
+    elif alternative == 'greater':
+        return upper(statistic)
+    elif alternative == 'less':
+        return lower(statistic)
+    raise Exception('Invalid alternative. Choose one of `two-sided`, `greater` or `less`.')
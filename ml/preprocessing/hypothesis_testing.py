@@ -1,19 +1,51 @@
 from os import stat
+import weakref
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import pandas as pd
 import numpy as np
 import pingouin as pg
 from pingouin import chi2_independence
 import warnings
-from scipy.stats import fisher_exact
+from scipy.stats import fisher_exact, rankdata, kendalltau, shapiro, pearsonr, spearmanr
+from scipy.stats import t as t_dist
+from ml.preprocessing.contingency import ContingencyTable, fisher_exact_batch, monte_carlo_chi2, _attach_codes, _screen_pairs
+from ml.preprocessing.multiple_testing import StreamingCorrection, adjust
+from ml.preprocessing import approximate, power, resampling
+from ml.preprocessing.groups import group_tests
+from ml.preprocessing.sequential import SequentialCorrelation, SequentialIndependence
+from ml.preprocessing.cache import ResultCache, cached
+from ml.preprocessing.streaming import Comoments, Moments, PairSample, weighted_ranks
+from ml.preprocessing.results import TestResult, ResultSet
+from ml.preprocessing.instrumentation import DISABLED, Profiler, input_size, instrumented
+
+NUMERIC_TYPES = [np.dtype(i) for i in [np.int32, np.int64, np.float32, np.float64]]
 
 class Tester:
 
-    def __init__(self):
+    def __init__(self, cache = False, cache_size = 128, cache_dir = None, cache_max_bytes = 2 ** 30, 
+                 lightweight = False, verbose = False, profiler = None):
         """
         Constructor
         
     	Parameters
     	----------            
+        cache : bool or ResultCache
+                if results should be cached, keyed by a fingerprint of the data and the parameters.
+                A ResultCache instance can be given to share the cache between Tester objects
+        cache_size : int
+                number of results kept in memory
+        cache_dir : string
+                directory of the on-disk cache tier, if None results are only kept in memory
+        cache_max_bytes : int
+                maximum total size of the on-disk cache tier
+        lightweight : bool
+                if tests return TestResult and batches return ResultSet objects instead of DataFrames
+        verbose : bool
+                if the reports of categorical tests are printed
+        profiler : Profiler
+                collects timers, counters and input sizes of every call, if None nothing is measured
                     
     	Returns
     	-------
@@ -21,15 +53,56 @@ class Tester:
         """
         self.selectors = {'compare_2_categorical':{'chi2':chi2_independence,
                                                                                 'fisher_exact':fisher_exact}}
+        self.kinds = {}
+        if isinstance(cache, ResultCache):
+            self.cache = cache
+        else:
+            self.cache = ResultCache(cache_size, cache_dir, cache_max_bytes) if cache else None
+        self.lightweight = lightweight
+        self.verbose = verbose
+        self.profiler = profiler
+
+    @contextmanager
+    def profile(self, profiler = None):
+        """
+        Measures the calls made inside the context
+
+    	Parameters
+    	----------            
+        profiler : Profiler
+                profiler receiving the measures, a new one if None
+                    
+    	Returns
+    	-------
+        context manager
+            yields the profiler
+        """
+        previous = self.profiler
+        self.profiler = Profiler() if profiler is None else profiler
+        try:
+            yield self.profiler
+        finally:
+            self.profiler = previous
+
+    def _phase(self, name, n = None):
+        return DISABLED if self.profiler is None else self.profiler.phase(name, n)
+
+    def _count(self, name):
+        if self.profiler is not None:
+            self.profiler.count(name)
 
-    def correlation_test(self, sample1, sample2, alpha = 0.05, alternative = 'two-sided', method = None, binary = ''):
+    @instrumented
+    @cached
+    def correlation_test(self, sample1, sample2 = None, alpha = 0.05, alternative = 'two-sided', method = None, binary = '', 
+                         approx = False, precision = 0.01, confidence = 0.99, seed = None, weights = None):
         """
         Tests the null hypothesis that there is no correlation between quantitative samples (sample1,sample2)
         
     	Parameters
     	----------            
-        sample1 : array_like
-                  Array of sample data, must be quantitative data.
+        sample1 : array_like or Comoments
+                  Array of sample data, must be quantitative data. Or the co-moments of both samples, such as the
+                  ones aggregated by DataBase.comoments, in which case sample2 is not given and the Pearson test is applied
         sample2 : array_like
                   Array of sample data, must be quantitative data.
         alpha : float
@@ -38,16 +111,36 @@ class Tester:
                  correlation test to be applied
         binary : string
                       flag to identify if data is binary
+        approx : bool
+                 if the test is approximated on growing uniform samples of the rows, until the decision the test
+                 would take on all the rows is known with the given confidence or the correlation is estimated
+                 with the given precision. The p-value is the one of the estimated correlation on all the rows,
+                 or the largest p-value in its confidence interval when the decision is not stable
+        precision : float
+                 half-width of the confidence interval of the correlation at which the sample stops growing
+        confidence : float
+                 confidence level of the interval of the correlation
+        seed : int
+                 seed of the random number generator used for the samples
+        weights : array_like
+                 frequency of every pair, for pre-aggregated samples (one row per distinct pair with its count).
+                 The test is computed from the distinct pairs without expanding them
                     
     	Returns
     	-------
-        pd.DataFrame
+        pd.DataFrame or TestResult
         """
-        sample1, sample2 = np.array(sample1), np.array(sample1) 
-        np_types = [np.dtype(i) for i in [np.int32, np.int64, np.float32, np.float64]]
-        sample1_dtypes, sample2_dtypes = sample1.dtype, sample2.dtype 
-        if any([not t in np_types for t in [sample1_dtypes, sample2_dtypes]]):
-            raise Exception('Non numerical variables... Try using categorical_test method instead.')
+        if isinstance(sample1, Comoments):
+            return self._comoments_correlation(sample1, alpha, alternative, method)
+        with self._phase('array conversion', len(sample1)):
+            sample1, sample2 = np.asarray(sample1), np.asarray(sample2)
+        self.check_numeric([sample1.dtype, sample2.dtype])
+        if weights is not None:
+            if approx:
+                raise Exception('approx is not available with weights.')
+            return self._weighted_correlation(sample1, sample2, weights, alpha, alternative, method, binary)
+        if approx:
+            return self._approx_correlation(sample1, sample2, alpha, alternative, method, precision, confidence, seed)
 
         report = ""
         if not method:
@@ -56,17 +149,17 @@ class Tester:
             elif binary == 'no':
                 check = False
             else:
-                check1 = self.check_binary(sample1)
-                check2 = self.check_binary(sample2)
+                with self._phase('check_binary', len(sample1)):
+                    check1 = self.check_binary(sample1)
+                    check2 = self.check_binary(sample2)
                 check = check1 and check2
 
             if check:
                 report += "Samples are binary, Pearson correlation is going to be applied (Point-biserial). "
                 return self.correlation(sample1, sample2, 'pearson', alpha, report, alternative)
             else:
-                check1 = self.normality_test(sample1).normal[0]
-                check2 = self.normality_test(sample2).normal[0]
-                check = check1 and check2
+                with self._phase('normality check', len(sample1)):
+                    check = (self._normality(np.column_stack([sample1, sample2]))[1] >= 0.05).all()
                 if check:
                     report += "Samples have normal distribution. "
                     return self.correlation(sample1, sample2, 'pearson', alpha, report, alternative)
@@ -77,99 +170,910 @@ class Tester:
             return self.correlation(sample1, sample2, method, alpha, report, alternative)
 
     def correlation(self, sample1, sample2, method, alpha, report, alternative):
-        df = pg.corr(sample1, sample2, method = method, tail = alternative)
-        result = True if df['p-val'][0] < alpha else False
+        if self.lightweight:
+            tests = {'pearson': pearsonr, 'spearman': spearmanr, 'kendall': kendalltau}
+            if not method in tests:
+                raise Exception('Invalid method. Choose one of `pearson`, `spearman` or `kendall`.')
+            with self._phase(method, len(sample1)):
+                statistic, p_value = tests[method](sample1, sample2, alternative = alternative)
+            return TestResult('correlation', method, float(statistic), float(p_value), alpha, len(sample1), report)
+        with self._phase('pg.corr', len(sample1)):
+            df = pg.corr(sample1, sample2, method = method, tail = alternative)
+        with self._phase('report'):
+            return self.correlation_report(df, method, alpha, report)
+
+    def _weighted_correlation(self, sample1, sample2, weights, alpha, alternative, method, binary):
+        weights = np.asarray(weights, dtype = np.float64)
+        if len(weights) != len(sample1) or len(sample1) != len(sample2):
+            raise Exception('Samples and weights must have the same length.')
+        if (weights < 0).any():
+            raise Exception('Frequency weights must not be negative.')
+        used = weights > 0
+        x, y, weights = sample1[used].astype(np.float64), sample2[used].astype(np.float64), weights[used]
+        report = "Frequency weights applied, {} distinct pairs. ".format(len(weights))
+        if not method:
+            if binary == 'yes' or (binary != 'no' and self.check_binary(x) and self.check_binary(y)):
+                report += "Samples are binary, Pearson correlation is going to be applied (Point-biserial). "
+                method = 'pearson'
+            elif (Moments().update(np.column_stack([x, y]), weights).normaltest()[1] >= 0.05).all():
+                report += "Samples have normal distribution. "
+                method = 'pearson'
+            else:
+                report += "Samples do not have normal distribution. "
+                method = 'spearman'
+        if method == 'spearman':
+            x, y = weighted_ranks(x, weights), weighted_ranks(y, weights)
+        elif method != 'pearson':
+            raise Exception('Invalid method. Choose one of `pearson` or `spearman`, Kendall is not available with weights.')
+        comoments = Comoments().update(x, y, weights)
+        r, n = comoments.r, comoments.n
+        p_value = self._corr_p_values(np.array([r]), n, alternative)[0]
+        if self.lightweight:
+            return TestResult('correlation', method, r, p_value, alpha, n, report)
+        df = pd.DataFrame({'n': [n], 'r': [r], 'p-val': [p_value]}, index = [method])
+        return self.correlation_report(df, method, alpha, report)
+
+    def _comoments_correlation(self, comoments, alpha, alternative, method):
+        if method not in (None, 'pearson'):
+            raise Exception('Only the Pearson correlation can be computed from co-moments.')
+        if comoments.n < 3:
+            raise Exception('Correlation test requires at least 3 observations.')
+        r, n = comoments.r, comoments.n
+        p_value = self._corr_p_values(np.array([r]), n, alternative)[0]
+        report = "Computed from the co-moments of {} pairs, Pearson correlation is applied. ".format(n)
+        if self.lightweight:
+            return TestResult('correlation', 'pearson', r, p_value, alpha, n, report)
+        df = pd.DataFrame({'n': [n], 'r': [r], 'p-val': [p_value]}, index = ['pearson'])
+        return self.correlation_report(df, 'pearson', alpha, report)
+
+    def _approx_correlation(self, sample1, sample2, alpha, alternative, method, precision, confidence, seed):
+        n_rows = len(sample1)
+        p_full = lambda values: self._corr_p_values(values, n_rows, alternative)
+        report = ""
+        start = approximate.initial_size(8 * precision, confidence)
+        for positions in approximate.growing_samples(n_rows, start, seed = seed):
+            with self._phase('sampling', len(positions)):
+                x, y = sample1[positions].astype(np.float64), sample2[positions].astype(np.float64)
+            if not method:
+                if self.check_binary(x) and self.check_binary(y):
+                    report += "Samples are binary, Pearson correlation is going to be applied (Point-biserial). "
+                    method = 'pearson'
+                elif (self._normality(np.column_stack([x, y]))[1] >= 0.05).all():
+                    report += "Samples have normal distribution. "
+                    method = 'pearson'
+                else:
+                    report += "Samples do not have normal distribution. "
+                    method = 'spearman'
+            with self._phase(method, len(positions)):
+                if method == 'kendall':
+                    r = float(kendalltau(x, y)[0])
+                else:
+                    r = float(self._corr_matrix(np.column_stack([x, y]), method == 'spearman')[0, 1])
+            lower, upper = approximate.correlation_interval(r, len(positions), method, confidence)
+            p_low, p_high = approximate.p_value_range(lower, upper, p_full)
+            stable = p_high < alpha or p_low >= alpha
+            if stable or (upper - lower) / 2 <= precision:
+                break
+        else:
+            return self.correlation_test(sample1, sample2, alpha, alternative, method)
+        p_value = p_full(np.array([r]))[0] if stable else p_high
+        report += "Approximated on a sample of {} of {} rows, with confidence {} r is in [{}, {}] and the p-value in [{}, {}], the decision is {}. ".format(
+            len(positions), n_rows, confidence, lower, upper, p_low, p_high, 'stable' if stable else 'not stable at the requested precision, the largest p-value is reported')
+        if self.lightweight:
+            return TestResult('correlation', method, r, p_value, alpha, len(positions), report)
+        df = pd.DataFrame({'n': [len(positions)], 'r': [r], 'r_lower': [lower], 'r_upper': [upper], 'p-val': [p_value], 
+                           'stable': [stable]}, index = [method])
+        return self.correlation_report(df, method, alpha, report)
+
+    def correlation_report(self, df, method, alpha, report):
+        result = True if df['p-val'].iloc[0] < alpha else False
         if result:
             report += "The alternative hypothesis is accepted, thus there is correlation between the samples. "
         else:
             report += "The null hypothesis is accepted, thus there is no correlation between the samples. " 
-        report += "Significance level considered = {},  test applied = {}, p-value = {}, test statistic = {}. ".format(alpha, method, df['p-val'][0], df['r'][0])
+        report += "Significance level considered = {},  test applied = {}, p-value = {}, test statistic = {}. ".format(alpha, method, df['p-val'].iloc[0], df['r'].iloc[0])
         df['report'] = report
         return df
 
+    @instrumented
+    def correlation_stream(self, chunks1, chunks2 = None, alpha = 0.05, alternative = 'two-sided', method = None, 
+                           sample_size = 100_000, seed = None):
+        """
+        Tests the null hypothesis that there is no correlation between quantitative samples given as
+        iterators of chunks, without holding the samples in memory. Pearson is computed exactly from
+        running co-moments, Spearman is approximated on a uniform sample of at most sample_size pairs.
+        
+    	Parameters
+    	----------            
+        chunks1 : iterable
+                  Chunks of sample data. If chunks2 is None, every chunk must hold both samples,
+                  as a pair (chunk1, chunk2) or a table with two columns.
+        chunks2 : iterable
+                  Chunks of sample data, aligned with chunks1.
+        alpha : float
+                               level of significance (default = 0.05)
+        alternative : string
+                 alternative hypothesis, one of `two-sided`, `greater` or `less`
+        method : string
+                 correlation test to be applied, one of `pearson` or `spearman`. If None it is chosen
+                 with the same rules as correlation_test, using the D'Agostino K² normality test
+        sample_size : int
+                 maximum number of pairs kept to approximate Spearman, its p-value is the one of a test on the sample
+        seed : int
+                 seed of the random number generator used for the Spearman sample
+                    
+    	Returns
+    	-------
+        pd.DataFrame or TestResult
+        """
+        if not method in (None, 'pearson', 'spearman'):
+            raise Exception('Invalid method. Choose one of `pearson` or `spearman`.')
+        pairs = zip(chunks1, chunks2) if chunks2 is not None else chunks1
+        comoments, moments, sample = Comoments(), Moments(), PairSample(sample_size, seed)
+        binary = True
+        for pair in pairs:
+            if isinstance(pair, pd.DataFrame):
+                chunk1, chunk2 = pair.iloc[:, 0].to_numpy(), pair.iloc[:, 1].to_numpy()
+            elif isinstance(pair, np.ndarray) and pair.ndim == 2:
+                chunk1, chunk2 = pair[:, 0], pair[:, 1]
+            else:
+                chunk1, chunk2 = np.asarray(pair[0]), np.asarray(pair[1])
+            self.check_numeric([chunk1.dtype, chunk2.dtype])
+            comoments.update(chunk1, chunk2)
+            if method != 'pearson':
+                sample.update(chunk1, chunk2)
+            if not method:
+                binary = binary and self.check_binary(chunk1) and self.check_binary(chunk2)
+                moments.update(np.column_stack([chunk1, chunk2]))
+
+        report = ""
+        if not method:
+            if binary:
+                report += "Samples are binary, Pearson correlation is going to be applied (Point-biserial). "
+                method = 'pearson'
+            elif (moments.normaltest()[1] >= 0.05).all():
+                report += "Samples have normal distribution. "
+                method = 'pearson'
+            else:
+                report += "Samples do not have normal distribution. "
+                method = 'spearman'
+        if method == 'pearson':
+            r, n = comoments.r, comoments.n
+        else:
+            # the p-value of the sampled r is the one of a test on the sample, not on the whole stream
+            r, n = self._corr_matrix(np.column_stack([sample.x, sample.y]), True)[0, 1], len(sample.x)
+            report += "Spearman correlation and its p-value computed on a sample of {} of {} pairs. ".format(n, comoments.n)
+        p_value = self._corr_p_values(np.array([r]), n, alternative)[0]
+        if self.lightweight:
+            return TestResult('correlation', method, r, p_value, alpha, n, report)
+        df = pd.DataFrame({'n': [n], 'r': [r], 'p-val': [p_value]}, index = [method])
+        return self.correlation_report(df, method, alpha, report)
+
+    def sequential_correlation(self, alpha = 0.05, tau = 0.1):
+        """
+        Starts an always-valid correlation test that absorbs observations in batches with update(sample1, sample2)
+        and can be checked with result() after every batch without inflating the error rate
+        
+    	Parameters
+    	----------            
+        alpha : float
+                               level of significance (default = 0.05)
+        tau : float
+                 standard deviation of the mixture over the Fisher z of the correlation
+                    
+    	Returns
+    	-------
+        SequentialCorrelation
+        """
+        return SequentialCorrelation(alpha, tau)
+
+    @instrumented
+    @cached
+    def correlation_matrix(self, df, alpha = 0.05, alternative = 'two-sided', method = None):
+        """
+        Tests the null hypothesis that there is no correlation for every pair of quantitative columns in df
+        
+    	Parameters
+    	----------            
+        df : pd.DataFrame or array_like
+                  Table of sample data, every column must be quantitative data.
+        alpha : float
+                               level of significance (default = 0.05)
+        alternative : string
+                 alternative hypothesis, one of `two-sided`, `greater` or `less`
+        method : string
+                 correlation test to be applied to every pair, if None it is chosen per pair
+                 with the same rules as correlation_test
+                    
+    	Returns
+    	-------
+        pd.DataFrame or ResultSet
+            one row per pair of columns with columns X, Y, method, n, r, p-val and reject
+        """
+        df = pd.DataFrame(df)
+        values = df.to_numpy()
+        self.check_numeric(df.dtypes)
+        values = values.astype(np.float64)
+        n, k = values.shape
+        rows, cols = np.triu_indices(k, 1)
+
+        if method == 'kendall':
+            tests = [kendalltau(values[:, i], values[:, j], alternative = alternative) for i, j in zip(rows, cols)]
+            r = np.array([test[0] for test in tests], dtype = np.float64)
+            p_values = np.array([test[1] for test in tests], dtype = np.float64)
+            methods = np.full(len(rows), 'kendall', dtype = object)
+        elif method in ('pearson', 'spearman'):
+            r = self._corr_matrix(values, method == 'spearman')[rows, cols]
+            p_values = self._corr_p_values(r, n, alternative)
+            methods = np.full(len(rows), method, dtype = object)
+        elif not method:
+            with self._phase('check_binary', n):
+                binary = np.array([self.check_binary(values[:, i]) for i in range(k)])
+            with self._phase('normality check', n):
+                normal = self._normality(values)[1] >= 0.05
+            use_pearson = (binary[rows] & binary[cols]) | (normal[rows] & normal[cols])
+            r = np.where(use_pearson, 
+                         self._corr_matrix(values, False)[rows, cols], 
+                         self._corr_matrix(values, True)[rows, cols])
+            p_values = self._corr_p_values(r, n, alternative)
+            methods = np.where(use_pearson, 'pearson', 'spearman').astype(object)
+        else:
+            raise Exception('Invalid method. Choose one of `pearson`, `spearman` or `kendall`.')
+
+        if self.lightweight:
+            return ResultSet('correlation', methods, r, p_values, alpha, X = df.columns[rows], Y = df.columns[cols])
+        return pd.DataFrame({'X': df.columns[rows], 'Y': df.columns[cols], 'method': methods, 
+                             'n': n, 'r': r, 'p-val': p_values, 'reject': p_values < alpha})
+
+    def _corr_matrix(self, values, rank):
+        """
+        Computes the correlation matrix of the columns of values with a single matrix product
+        
+    	Parameters
+    	----------            
+        values : np.ndarray
+                  2-D array of sample data, one sample per column
+        rank : bool
+                  if True the columns are ranked first (Spearman)
+                    
+    	Returns
+    	-------
+        np.ndarray
+        """
+        if rank:
+            values = rankdata(values, axis = 0)
+        centered = values - values.mean(axis = 0)
+        norms = np.sqrt((centered ** 2).sum(axis = 0))
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            standardized = centered / norms
+        return np.clip(standardized.T @ standardized, -1, 1)
+
+    def _corr_p_values(self, r, n, alternative):
+        """
+        Computes the p-values of correlation coefficients using the t distribution with n - 2 degrees of freedom
+        
+    	Parameters
+    	----------            
+        r : np.ndarray
+                  correlation coefficients
+        n : int
+                  number of observations
+        alternative : string
+                  alternative hypothesis, one of `two-sided`, `greater` or `less`
+                    
+    	Returns
+    	-------
+        np.ndarray
+        """
+        dof = n - 2
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            statistic = r * np.sqrt(dof / (1 - r ** 2))
+        if alternative == 'two-sided':
+            return 2 * t_dist.sf(np.abs(statistic), dof)
+        elif alternative == 'greater':
+            return t_dist.sf(statistic, dof)
+        elif alternative == 'less':
+            return t_dist.cdf(statistic, dof)
+        raise Exception('Invalid alternative. Choose one of `two-sided`, `greater` or `less`.')
+
+    def check_numeric(self, dtypes):
+        """
+        Raises an exception if any of the dtypes is not a supported numerical type
+        
+    	Parameters
+    	----------            
+        dtypes : iterable
+                  dtypes of the samples to be tested
+                    
+    	Returns
+    	-------
+        None
+        """
+        if any([not np.dtype(t) in NUMERIC_TYPES for t in dtypes]):
+            raise Exception('Non numerical variables... Try using categorical_test method instead.')
+
     def check_binary(self, col):
-        for data in col:
-            if data != 0 and data !=1:
-                return False
-        return True
+        return self.check_kind(col) == 'binary'
+
+    def check_kind(self, col, chunk_size = 1_000_000):
+        """
+        Classifies a quantitative sample as `binary` (only 0 and 1), `constant`, `integer` or `continuous`.
+        The sample is scanned in chunks and the scan stops as soon as it is known to be continuous.
+        The result is cached per underlying buffer together with a sample of its elements, so repeated
+        calls on the same column are free and a buffer modified in place, or reused for another chunk,
+        is classified again unless the change misses every sampled element.
+        
+    	Parameters
+    	----------            
+        col : array_like
+                  Array of sample data.
+        chunk_size : int
+                  number of elements evaluated per chunk
+                    
+    	Returns
+    	-------
+        string
+        """
+        col = np.asarray(col)
+        key = self._buffer_key(col)
+        flat = col.reshape(-1)
+        # first, last and evenly spaced elements, a cheap check that the content did not change
+        content = hash(flat[np.linspace(0, flat.size - 1, min(flat.size, 65)).astype(np.int64)].tobytes())
+        if key in self.kinds:
+            owner, sample, kind = self.kinds[key]
+            if owner() is not None and sample == content:
+                self._count('check_kind hit')
+                return kind
+        self._count('check_kind miss')
+        binary, constant = True, True
+        integer = flat.dtype.kind in 'iub'
+        check_integer = not integer
+        first = flat[0] if flat.size else None
+        for start in range(0, flat.size, chunk_size):
+            chunk = flat[start:start + chunk_size]
+            if binary:
+                binary = bool(((chunk == 0) | (chunk == 1)).all())
+            if constant:
+                constant = bool((chunk == first).all())
+            if check_integer:
+                integer = bool((np.floor(chunk) == chunk).all())
+                check_integer = integer
+            if not (binary or constant or integer):
+                break
+        if binary:
+            kind = 'binary'
+        elif constant:
+            kind = 'constant'
+        elif integer:
+            kind = 'integer'
+        else:
+            kind = 'continuous'
+        # entries of released buffers are dropped, their addresses may be reused by other arrays
+        for dead in [k for k, (owner, _, _) in self.kinds.items() if owner() is None]:
+            del self.kinds[dead]
+        self.kinds[key] = (weakref.ref(self._buffer_owner(col)), content, kind)
+        return kind
+
+    def _buffer_key(self, col):
+        """
+        Identifies the memory buffer of an array by its address, shape, strides and dtype
+        
+    	Parameters
+    	----------            
+        col : np.ndarray
+                  Array of sample data.
+                    
+    	Returns
+    	-------
+        tuple
+        """
+        return (col.__array_interface__['data'][0], col.shape, col.strides, col.dtype.str)
+
+    def _buffer_owner(self, col):
+        """
+        Returns the array that owns the memory of col, used to detect when a cached buffer is released
+        
+    	Parameters
+    	----------            
+        col : np.ndarray
+                  Array of sample data.
+                    
+    	Returns
+    	-------
+        np.ndarray
+        """
+        while isinstance(col.base, np.ndarray):
+            col = col.base
+        return col
 
-    def categorical_test(self, data, sample1, sample2, alpha = 0.05, method = None):
+    @instrumented
+    @cached(frame = 'data', columns = ('sample1', 'sample2', 'weights'))
+    def categorical_test(self, data, sample1 = None, sample2 = None, alpha = 0.05, method = None, approx = False, 
+                         precision = 0.01, confidence = 0.99, seed = None, weights = None, n_resamples = 10000, 
+                         n_jobs = 1):
         """
-        Tests the null hypothesis that the categorical samples (sample1,sample2) are not dependent
+        Tests the null hypothesis that the categorical samples (sample1,sample2) are not dependent. 2x2 tables
+        are tested with Fisher exact, other tables with Pearson chi-squared, or with the Monte Carlo exact test
+        when some expected count is below 5 and the asymptotic chi-squared distribution is not valid.
         
     	Parameters
     	----------            
-        data : pandas.DataFrame
-                The dataframe containing the ocurrences for the test.
+        data : pandas.DataFrame or ContingencyTable
+                The dataframe containing the ocurrences for the test. If sample1 and sample2 are None, data is
+                a pre-built contingency table: a ContingencyTable or a table of counts such as pd.crosstab.
         sample1, sample2 : string
                 The variables names for the Chi-squared test. Must be names of columns in ``data``.
         alpha : float
                 level of significance (default = 0.05)
         method : string
-                test to be applied
+                test to be applied, one of `fisher`, `chi2` or `monte_carlo`. If None it is chosen as described above.
+                `fisher` on a table larger than 2x2 applies the Monte Carlo exact test
+        approx : bool
+                if Pearson chi-squared is approximated on growing uniform samples of the rows, until the decision
+                the test would take on all the rows is known with the given confidence or Cohen's w is estimated
+                with the given precision. The statistic and p-value are the ones estimated for all the rows,
+                the p-value is the largest in its confidence interval when the decision is not stable
+        precision : float
+                half-width of the confidence interval of Cohen's w at which the sample stops growing
+        confidence : float
+                confidence level of the interval of Cohen's w
+        seed : int
+                seed of the random number generator used for the samples or the simulated tables
+        weights : string or array_like
+                frequency of every row, as the name of a column of data or an array, for pre-aggregated
+                samples (one row per distinct pair of categories with its count)
+        n_resamples : int
+                maximum number of tables simulated by the Monte Carlo exact test
+        n_jobs : int
+                number of processes simulating tables
                     
     	Returns
     	-------
-        pd.DataFrame
+        pd.DataFrame or TestResult
         """
-        sample1_array, sample2_array = data[sample1], data[sample2]
-        report = ""
-        if not method:
-            if len(sample1_array.unique()) == 2 and len(sample2_array.unique()) == 2:
-                table = pd.crosstab(sample1_array, sample2_array)
-                statistic, p_value = fisher_exact(table)
-                self.categorical('fisher exact', statistic, p_value, alpha, report)
-                return pd.DataFrame([('fisher exact', statistic, p_value)], columns = ['test', 'statistic', 'p_value'])
-            else:
-                if (data.groupby([sample1, sample2]).size() <= 5).sum():
-                    warnings.warn("Warning: Algum valor esperado é menor do que 5. O teste pode ser inválido")
-                expected, observed, stats = pg.chi2_independence(data, sample1, sample2)
-                print("Expected Distribution")
-                pg.print_table(expected.reset_index())
-                print("Observed Distribution")
-                pg.print_table(observed.reset_index())
-                print("Statistics")
-                p_value = stats.loc[stats['test'] == 'pearson']['pval'][0]
-                statistic = stats.loc[stats['test'] == 'pearson']['chi2'][0]
-                self.categorical('pearson chi-squared', statistic, p_value, alpha, report)
-                return stats
-        elif method == 'fisher':
-            if not (len(sample1_array.unique()) == 2 and len(sample2_array.unique()) == 2):
-                warnings.warn("Contigency table is not 2x2, Fisher exact cannot be used.")
-                if (data.groupby([sample1, sample2]).size() <= 5).sum():
-                    warnings.warn("Warning: Algum valor esperado é menor do que 5. O teste pode ser inválido")
-                expected, observed, stats = pg.chi2_independence(data, sample1, sample2)
-                print("Expected Distribution")
-                pg.print_table(expected.reset_index())
-                print("Observed Distribution")
-                pg.print_table(observed.reset_index())
-                print("Statistics")
-                p_value = stats.loc[stats['test'] == 'pearson']['pval'][0]
-                statistic = stats.loc[stats['test'] == 'pearson']['chi2'][0]
-                self.categorical('pearson chi-squared', statistic, p_value, alpha, report)
-                return stats
+        if approx:
+            if weights is not None or (sample1 is None and sample2 is None):
+                raise Exception('approx is not available with weights or contingency tables.')
+            return self._approx_categorical(data, sample1, sample2, alpha, method, precision, confidence, seed)
+        with self._phase('contingency table', input_size((data,))):
+            if isinstance(data, ContingencyTable):
+                table = data
+            elif sample1 is None and sample2 is None:
+                table = ContingencyTable.from_frame(data)
             else:
-                table = pd.crosstab(sample1_array, sample2_array)
-                statistic, p_value = fisher_exact(table)
-                self.categorical('fisher exact', statistic, p_value, alpha, report)
-                return pd.DataFrame([('fisher exact', statistic, p_value)], columns = ['test', 'statistic', 'p_value'])
-        elif method == 'chi2':
-            if (data.groupby([sample1, sample2]).size() <= 5).sum():
-                    warnings.warn("Warning: Algum valor esperado é menor do que 5. O teste pode ser inválido")
-            expected, observed, stats = pg.chi2_independence(data, sample1, sample2)
-            print("Expected Distribution")
-            pg.print_table(expected.reset_index())
-            print("Observed Distribution")
-            pg.print_table(observed.reset_index())
-            print("Statistics")
-            p_value = stats.loc[stats['test'] == 'pearson']['pval'][0]
-            statistic = stats.loc[stats['test'] == 'pearson']['chi2'][0]
+                if isinstance(weights, str):
+                    weights = data[weights]
+                table = ContingencyTable.from_samples(data[sample1], data[sample2], weights)
+        report = ""
+        if not method in (None, 'fisher', 'chi2', 'monte_carlo'):
+            raise Exception('Invalid method. Choose one of `fisher`, `chi2` or `monte_carlo`.')
+        if method in (None, 'fisher') and table.shape == (2, 2):
+            with self._phase('fisher exact'):
+                statistic, p_value = fisher_exact(table.observed.toarray())
+            self.categorical('fisher exact', statistic, p_value, alpha, report)
+            if self.lightweight:
+                return TestResult('dependency', 'fisher exact', statistic, p_value, alpha, table.n, report)
+            return pd.DataFrame([('fisher exact', statistic, p_value)], columns = ['test', 'statistic', 'p_value'])
+        if table.dof > 0 and (method in ('fisher', 'monte_carlo') or (method is None and table.expected_below(5))):
+            if method == 'fisher':
+                report += "Contingency table is not 2x2, the Monte Carlo exact test is going to be applied. "
+            elif method is None:
+                report += "Some expected counts are below 5, the Monte Carlo exact test is going to be applied. "
+            return self.monte_carlo_test(table, alpha, report, n_resamples, seed, n_jobs)
+        return self.chi2_test(table, alpha, report)
+
+    def monte_carlo_test(self, table, alpha, report, n_resamples = 10000, seed = None, n_jobs = 1):
+        """
+        Monte Carlo exact test of independence: the p-value is the share of random tables with the margins of
+        table whose Pearson chi-squared statistic is at least the observed one. Valid for small expected counts.
+        
+    	Parameters
+    	----------            
+        table : ContingencyTable
+                table of integer counts
+        alpha : float
+                level of significance, the simulation stops once the decision at alpha is settled
+        report : string
+                checks made before the test
+        n_resamples : int
+                maximum number of simulated tables
+        seed : int
+                seed of the random number generator, results do not depend on n_jobs
+        n_jobs : int
+                number of processes simulating tables
+                    
+    	Returns
+    	-------
+        pd.DataFrame or TestResult
+        """
+        with self._phase('monte carlo', n_resamples):
+            statistic, p_value, done = monte_carlo_chi2(table, n_resamples, alpha, seed, n_jobs = n_jobs)
+        report += "Simulated tables = {}. ".format(done)
+        self.categorical('monte carlo chi-squared', statistic, p_value, alpha, report)
+        if self.lightweight:
+            return TestResult('dependency', 'monte carlo chi-squared', statistic, p_value, alpha, table.n, report)
+        return pd.DataFrame([('monte carlo chi-squared', statistic, float(table.dof), p_value, done, 
+                              table.cramer_v(statistic))], 
+                            columns = ['test', 'chi2', 'dof', 'pval', 'simulations', 'cramer'])
+
+    def _approx_categorical(self, data, sample1, sample2, alpha, method, precision, confidence, seed):
+        n_rows = len(data)
+        values1, values2 = data[sample1].to_numpy(), data[sample2].to_numpy()
+        start = approximate.initial_size(8 * precision, confidence)
+        for positions in approximate.growing_samples(n_rows, start, seed = seed):
+            with self._phase('contingency table', len(positions)):
+                table = ContingencyTable.from_samples(values1[positions], values2[positions])
+            if table.dof < 1:
+                continue
+            statistic = table.chi2(correction = False)[0]
+            n_full = n_rows * table.n / len(positions)
+            p_full = lambda values: approximate.chi2_p_values(values, n_full, table.dof)
+            w2, lower, upper = approximate.effect_interval(statistic, table.n, table.dof, confidence)
+            p_low, p_high = approximate.p_value_range(lower, upper, p_full)
+            stable = p_high < alpha or p_low >= alpha
+            if stable or (np.sqrt(upper) - np.sqrt(lower)) / 2 <= precision:
+                break
+        else:
+            return self.categorical_test(data, sample1, sample2, alpha, method)
+        p_value = float(p_full(w2)) if stable else p_high
+        cramer, cramer_lower, cramer_upper = [table.cramer_v(value * table.n) for value in (w2, lower, upper)]
+        report = "Approximated on a sample of {} of {} rows, with confidence {} Cramer's V is in [{}, {}] and the p-value in [{}, {}], the decision is {}. ".format(
+            len(positions), n_rows, confidence, cramer_lower, cramer_upper, p_low, p_high, 'stable' if stable else 'not stable at the requested precision, the largest p-value is reported')
+        self.categorical('pearson chi-squared', w2 * n_full, p_value, alpha, report)
+        if self.lightweight:
+            return TestResult('dependency', 'pearson chi-squared', w2 * n_full, p_value, alpha, table.n, report)
+        return pd.DataFrame([('pearson chi-squared', table.n, w2 * n_full, float(table.dof), p_value, cramer, cramer_lower, 
+                              cramer_upper, stable)], 
+                            columns = ['test', 'n', 'chi2', 'dof', 'pval', 'cramer', 'cramer_lower', 'cramer_upper', 'stable'])
+
+    def sequential_categorical(self, rows, cols, alpha = 0.05):
+        """
+        Starts an always-valid independence test of two categorical samples that absorbs observations in batches
+        with update(sample1, sample2) and can be checked with result() after every batch
+        
+    	Parameters
+    	----------            
+        rows, cols : list
+                every category of each sample
+        alpha : float
+                level of significance (default = 0.05)
+                    
+    	Returns
+    	-------
+        SequentialIndependence
+        """
+        return SequentialIndependence(rows, cols, alpha)
+
+    def chi2_test(self, table, alpha, report):
+        """
+        Applies the Pearson chi-squared and the log-likelihood (G) tests of independence to a contingency table
+        
+    	Parameters
+    	----------            
+        table : ContingencyTable
+                contingency table of the samples
+        alpha : float
+                level of significance
+        report : string
+                report of the checks already made
+                    
+    	Returns
+    	-------
+        pd.DataFrame or TestResult
+        """
+        if table.expected_below(5):
+            warnings.warn("Warning: Algum valor esperado é menor do que 5. O teste pode ser inválido")
+        with self._phase('chi2', table.n):
+            statistic, p_value = table.chi2()
+        if self.lightweight:
             self.categorical('pearson chi-squared', statistic, p_value, alpha, report)
-            return stats
+            return TestResult('dependency', 'pearson chi-squared', statistic, p_value, alpha, table.n, report)
+        with self._phase('g-test', table.n):
+            g_statistic, g_p_value = table.g_test()
+        stats = pd.DataFrame({'test': ['pearson', 'log-likelihood'], 'lambda': [1.0, 0.0], 
+                              'chi2': [statistic, g_statistic], 'dof': float(table.dof), 
+                              'pval': [p_value, g_p_value], 
+                              'cramer': [table.cramer_v(statistic), table.cramer_v(g_statistic)]})
+        self.categorical('pearson chi-squared', statistic, p_value, alpha, report)
+        return stats
+
+    @instrumented
+    @cached
+    def categorical_screen(self, df, target = None, alpha = 0.05, correction = 'fdr_bh', n_jobs = 1, batch_size = 64):
+        """
+        Tests the null hypothesis that the categorical samples are not dependent for the target against
+        every other column of df, or for every pair of columns if target is None. Each pair is tested with
+        Fisher exact if its contingency table is 2x2 and with Pearson chi-squared otherwise.
+        
+    	Parameters
+    	----------            
+        df : pandas.DataFrame
+                The dataframe containing the ocurrences for the test, one categorical sample per column.
+        target : string
+                name of the column tested against every other column, if None all pairs are tested
+        alpha : float
+                level of significance (default = 0.05)
+        correction : string
+                multiple testing correction applied to the p-values, one of `bonferroni`, `holm`, `fdr_bh` or `fdr_by`
+        n_jobs : int
+                number of processes, the codes of the columns are shared with them through shared memory
+        batch_size : int
+                number of pairs sent to a process at a time
+                    
+    	Returns
+    	-------
+        pd.DataFrame or ResultSet
+            one row per pair with columns X, Y, test, statistic, p_value, p_adjusted, reject and low_expected
+        """
+        columns = list(df.columns)
+        with self._phase('factorize', len(df)):
+            factorized = [pd.factorize(df[col], sort = True) for col in columns]
+            codes = np.asfortranarray(np.column_stack([codes.astype(np.int32) for codes, _ in factorized]))
+        labels = [np.asarray(uniques) for _, uniques in factorized]
+        if target is None:
+            pairs = list(zip(*np.triu_indices(len(columns), 1)))
+        else:
+            position = columns.index(target)
+            pairs = [(position, j) for j in range(len(columns)) if j != position]
+
+        if n_jobs == 1 or len(pairs) <= batch_size:
+            with self._phase('screen pairs', len(pairs)):
+                results = _screen_pairs(pairs, codes, labels)
+        else:
+            memory = shared_memory.SharedMemory(create = True, size = codes.nbytes)
+            try:
+                np.ndarray(codes.shape, dtype = codes.dtype, buffer = memory.buf, order = 'F')[:] = codes
+                batches = [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)]
+                with ProcessPoolExecutor(max_workers = n_jobs, initializer = _attach_codes, 
+                                         initargs = (memory.name, codes.shape, codes.dtype, labels)) as executor:
+                    with self._phase('screen pairs', len(pairs)):
+                        results = [result for batch in executor.map(_screen_pairs, batches) for result in batch]
+            finally:
+                memory.close()
+                memory.unlink()
+
+        screen = pd.DataFrame(results, columns = ['test', 'statistic', 'p_value', 'low_expected'])
+        if self.lightweight:
+            return ResultSet('dependency', screen['test'], screen['statistic'], screen['p_value'], alpha, 
+                             adjust(screen['p_value'].to_numpy(), correction) if len(screen) else [], 
+                             X = [columns[i] for i, _ in pairs], Y = [columns[j] for _, j in pairs], 
+                             low_expected = screen['low_expected'])
+        screen.insert(0, 'X', [columns[i] for i, _ in pairs])
+        screen.insert(1, 'Y', [columns[j] for _, j in pairs])
+        screen['p_adjusted'] = adjust(screen['p_value'].to_numpy(), correction) if len(screen) else []
+        screen['reject'] = screen['p_adjusted'] < alpha
+        return screen[['X', 'Y', 'test', 'statistic', 'p_value', 'p_adjusted', 'reject', 'low_expected']]
+
+    def fisher_batch(self, tables, alternative = 'two-sided'):
+        """
+        Applies the Fisher exact test to a batch of 2x2 contingency tables at once
+        
+    	Parameters
+    	----------            
+        tables : array_like
+                counts with shape (n, 2, 2), one table per test
+        alternative : string
+                alternative hypothesis, one of `two-sided`, `less` or `greater`
+                    
+    	Returns
+    	-------
+        tuple
+            (odds ratios, p-values), arrays of length n
+        """
+        return fisher_exact_batch(tables, alternative)
+
+    def multiple_testing(self, results, method = 'fdr_bh', alpha = 0.05):
+        """
+        Adjusts a batch of test results for multiple comparisons
+
+    	Parameters
+    	----------
+        results : ResultSet, list, pd.DataFrame or array_like
+                results of the tests: a ResultSet, a list of TestResult, a DataFrame returned by a batch
+                method (with a p_value, p-val or pval column) or the p-values themselves
+        method : string
+                correction to be applied, one of `bonferroni`, `holm`, `fdr_bh` or `fdr_by`
+        alpha : float
+                level of significance, used for the reject column of DataFrames (default = 0.05)
+
+    	Returns
+    	-------
+        ResultSet, pd.DataFrame or np.ndarray
+            the ResultSet with adjusted p-values, a copy of the DataFrame with p_adjusted and reject
+            columns, or the adjusted p-values
+        """
+        if isinstance(results, ResultSet):
+            return results.adjust(method)
+        if isinstance(results, list) and results and isinstance(results[0], TestResult):
+            return ResultSet.from_results(results).adjust(method)
+        if isinstance(results, pd.DataFrame):
+            column = [col for col in ['p_value', 'p-val', 'pval'] if col in results.columns]
+            if not column:
+                raise Exception('The DataFrame must have a p_value, p-val or pval column.')
+            df = results.copy()
+            df['p_adjusted'] = adjust(df[column[0]].to_numpy(), method)
+            df['reject'] = df['p_adjusted'] < alpha
+            return df
+        return adjust(results, method)
+
+    def multiple_testing_stream(self, batches, method = 'fdr_bh', alpha = 0.05):
+        """
+        Multiple testing correction for more p-values than fit in memory, reading the batches twice.
+        The decisions are exact and made batch by batch with the decide method of the returned object.
+
+    	Parameters
+    	----------
+        batches : callable
+                function without arguments returning an iterable over the batches of p-values,
+                called once per pass and yielding the same batches each time
+        method : string
+                correction to be applied, one of `bonferroni`, `holm`, `fdr_bh` or `fdr_by`
+        alpha : float
+                level of significance (default = 0.05)
+
+    	Returns
+    	-------
+        StreamingCorrection
+        """
+        correction = StreamingCorrection(method, alpha)
+        for p_values in batches():
+            correction.observe(p_values)
+        for p_values in batches():
+            correction.collect(p_values)
+        return correction
+
+    def power(self, test, effect, n, alpha = 0.05, alternative = 'two-sided', dof = 1, n_groups = 2, 
+              interpolate = False, grid_dir = None):
+        """
+        Power of a correlation, chi-squared or group test for given effect sizes and sample sizes
+        
+    	Parameters
+    	----------            
+        test : string
+                one of `correlation` (effect: r), `chi2` (effect: Cohen's w), `ttest` or `mannwhitney` 
+                (effect: Cohen's d), `anova` or `kruskal` (effect: Cohen's f)
+        effect : float or array_like
+                effect sizes
+        n : int or array_like
+                total number of observations for `correlation` and `chi2`, observations per group otherwise
+        alpha : float
+                level of significance (default = 0.05)
+        alternative : string
+                alternative hypothesis, one of `two-sided`, `greater` or `less`
+        dof : int
+                degrees of freedom of `chi2`
+        n_groups : int
+                number of groups of `anova` and `kruskal`
+        interpolate : bool
+                if the power is interpolated on a precomputed grid instead of computed exactly
+        grid_dir : string
+                directory where the interpolation grids are stored, if None they are only kept in memory
+                    
+    	Returns
+    	-------
+        float or np.ndarray
+        """
+        if interpolate:
+            return power.grid(test, alpha, alternative, dof, n_groups, grid_dir).power(effect, n)
+        return power.power(test, effect, n, alpha, alternative, dof, n_groups)
+
+    def sample_size(self, test, effect, power_target = 0.8, alpha = 0.05, alternative = 'two-sided', dof = 1, 
+                    n_groups = 2, interpolate = False, grid_dir = None):
+        """
+        Smallest sample size for a correlation, chi-squared or group test to reach the target power
+        
+    	Parameters
+    	----------            
+        test : string
+                test, see power
+        effect : float or array_like
+                effect sizes
+        power_target : float or array_like
+                power to be reached (default = 0.8)
+        alpha : float
+                level of significance (default = 0.05)
+        alternative : string
+                alternative hypothesis, one of `two-sided`, `greater` or `less`
+        dof : int
+                degrees of freedom of `chi2`
+        n_groups : int
+                number of groups of `anova` and `kruskal`
+        interpolate : bool
+                if the sample size is interpolated on a precomputed grid instead of solved exactly
+        grid_dir : string
+                directory where the interpolation grids are stored, if None they are only kept in memory
+                    
+    	Returns
+    	-------
+        float or np.ndarray
+            total number of observations for `correlation` and `chi2`, observations per group otherwise
+        """
+        if interpolate:
+            return power.grid(test, alpha, alternative, dof, n_groups, grid_dir).sample_size(effect, power_target)
+        return power.sample_size(test, effect, power_target, alpha, alternative, dof, n_groups)
+
+    @instrumented
+    def permutation_test(self, sample1, sample2, statistic = 'correlation', alpha = 0.05, alternative = 'two-sided', 
+                         n_resamples = 10000, seed = None, early_stop = True, memory_budget = 2 ** 27, n_jobs = 1):
+        """
+        Permutation test of the null hypothesis of no correlation (`correlation`), no difference in means 
+        (`mean_difference`) or independence of categorical samples (`chi2`), without asymptotic assumptions
+        
+    	Parameters
+    	----------            
+        sample1, sample2 : array_like
+                Arrays of sample data. Paired for `correlation` and `chi2`, independent groups for `mean_difference`.
+        statistic : string
+                one of `correlation`, `mean_difference` or `chi2`
+        alpha : float
+                level of significance (default = 0.05)
+        alternative : string
+                alternative hypothesis, one of `two-sided`, `greater` or `less` (ignored for `chi2`)
+        n_resamples : int
+                maximum number of permutations
+        seed : int
+                seed of the random number generator
+        early_stop : bool
+                if the permutations stop as soon as the decision at alpha is settled
+        memory_budget : int
+                approximate number of bytes used by a block of permutations
+        n_jobs : int
+                number of processes evaluating blocks of permutations
+                    
+    	Returns
+    	-------
+        pd.DataFrame or TestResult
+        """
+        data = resampling.prepare(statistic, sample1, sample2)
+        value = resampling.observed(data)
+        p_value, done = resampling.permutation_test(data, alternative, n_resamples, alpha, seed, early_stop, 
+                                                    memory_budget = memory_budget, n_jobs = n_jobs)
+        if self.lightweight:
+            hypothesis = {'correlation': 'correlation', 'mean_difference': 'difference', 'chi2': 'dependency'}[statistic]
+            return TestResult(hypothesis, 'permutation ' + statistic, value, p_value, alpha, resampling.size(data), 
+                              "Permutations = {}. ".format(done))
+        if p_value < alpha:
+            report = "The null hypothesis is rejected. "
         else:
-            raise Exception('Invalid method. Choose one of `fisher` or `chi2`.')
-                
+            report = "The null hypothesis is not rejected. "
+        report += "Significance level considered = {},  test applied = permutation {}, permutations = {}, p-value = {}, test statistic = {}. ".format(alpha, statistic, done, p_value, value)
+        return pd.DataFrame([(statistic, done, value, p_value, report)], 
+                            columns = ['test', 'permutations', 'statistic', 'p_value', 'report'])
+
+    @instrumented
+    def bootstrap_ci(self, sample1, sample2, statistic = 'correlation', alpha = 0.05, n_resamples = 10000, 
+                     seed = None, memory_budget = 2 ** 27):
+        """
+        Percentile bootstrap confidence interval of the correlation (`correlation`) or the difference in means
+        (`mean_difference`) of the samples
+        
+    	Parameters
+    	----------            
+        sample1, sample2 : array_like
+                Arrays of sample data. Paired for `correlation`, independent groups for `mean_difference`.
+        statistic : string
+                one of `correlation` or `mean_difference`
+        alpha : float
+                the interval has confidence 1 - alpha (default = 0.05)
+        n_resamples : int
+                number of bootstrap resamples
+        seed : int
+                seed of the random number generator
+        memory_budget : int
+                approximate number of bytes used by a block of resamples
+                    
+    	Returns
+    	-------
+        pd.DataFrame
+        """
+        data = resampling.prepare(statistic, sample1, sample2)
+        error, lower, upper = resampling.bootstrap(data, n_resamples, alpha, seed, memory_budget)
+        return pd.DataFrame([(statistic, resampling.observed(data), error, lower, upper)], 
+                            columns = ['test', 'statistic', 'std_error', 'ci_lower', 'ci_upper'])
+
     def categorical(self, method, statistic, p_value, alpha, report):
+        if not self.verbose:
+            return
         if p_value < alpha:
             report += "The null hypothesis is rejected, thus there is evidence of dependency between the samples"
         else:
@@ -179,36 +1083,192 @@ class Tester:
         print()
         
 
-    def normality_test(self, sample, alpha = 0.05, method = 'shapiro'):
+    @instrumented
+    @cached(frame = 'df', columns = ('value', 'group'))
+    def group_test(self, df, value, group, alpha = 0.05, alternative = 'two-sided', method = None):
+        """
+        Tests the null hypothesis that the quantitative sample `value` does not differ between the groups
+        of `group`. If method is None, a parametric test (Welch t-test for two groups, one-way ANOVA otherwise)
+        is applied when the sample has normal distribution in every group, and a rank test (Mann-Whitney U
+        for two groups, Kruskal-Wallis H otherwise) is applied when it does not.
+        
+    	Parameters
+    	----------            
+        df : pandas.DataFrame
+                The dataframe containing the sample and the groups.
+        value : string
+                name of the column of quantitative data
+        group : string
+                name of the column with the groups
+        alpha : float
+                level of significance (default = 0.05)
+        alternative : string
+                alternative hypothesis for two groups, one of `two-sided`, `greater` or `less`,
+                comparing the first group (in sorted order) with the second
+        method : string
+                one of `ttest`, `mannwhitney`, `anova` or `kruskal`
+                    
+    	Returns
+    	-------
+        pd.DataFrame or TestResult
+        """
+        results = self.group_test_batch(df, [value], group, alpha, alternative, method)
+        if self.lightweight:
+            return results[0]
+        return results.drop(columns = ['value', 'reject']).reset_index(drop = True)
+
+    @instrumented
+    @cached(frame = 'df', columns = ('values', 'group'))
+    def group_test_batch(self, df, values, group, alpha = 0.05, alternative = 'two-sided', method = None):
+        """
+        Applies group_test to many quantitative columns against the same groups at once. Rows with a missing
+        group are ignored, a missing value is only left out of the test of its own column.
+        
+    	Parameters
+    	----------            
+        df : pandas.DataFrame
+                The dataframe containing the samples and the groups.
+        values : list
+                names of the columns of quantitative data
+        group : string
+                name of the column with the groups
+        alpha : float
+                level of significance (default = 0.05)
+        alternative : string
+                alternative hypothesis for two groups, one of `two-sided`, `greater` or `less`
+        method : string
+                one of `ttest`, `mannwhitney`, `anova` or `kruskal`, if None it is chosen per column
+                    
+    	Returns
+    	-------
+        pd.DataFrame or ResultSet
+            one row per column with columns value, test, statistic, p_value, reject and report
+        """
+        self.check_numeric(df[values].dtypes)
+        data = df[values + [group]].dropna(subset = [group])
+        with self._phase('factorize', len(df)):
+            codes, groups = pd.factorize(data[group], sort = True)
+            samples = data[values].to_numpy(dtype = np.float64)
+        with self._phase('group tests', len(samples)):
+            methods, statistic, p_values = group_tests(samples, codes, len(groups), method, alternative)
+        results = ResultSet('difference', methods, statistic, p_values, alpha, value = values)
+        if self.lightweight:
+            return results
+        return results.to_frame(report = True)
+
+    @instrumented
+    @cached
+    def normality_test(self, sample, alpha = 0.05, method = 'auto', max_shapiro = 5000, seed = 0):
         """
-        Tests the null hypothesis that the data was drawn from a normal distribution
+        Tests the null hypothesis that the data was drawn from a normal distribution. Shapiro-Wilk is applied
+        to at most max_shapiro observations, larger samples are tested on a stratified subsample. Moment based
+        tests are computed over chunks of the sample, in linear time and bounded memory.
         
     	Parameters
     	----------            
         sample : array_like
-                  Array of sample data.
+                  Array of sample data, missing values are ignored.
         alpha : float
                                level of significance (default = 0.05)
-        test : string
-                 normality test to be applied
+        method : string
+                 normality test to be applied, one of `shapiro`, `normaltest` (D'Agostino K²), `jarque_bera`
+                 or `auto`, which applies Shapiro-Wilk up to max_shapiro observations and D'Agostino K² above
+        max_shapiro : int
+                 maximum number of observations given to Shapiro-Wilk
+        seed : int
+                 seed of the random number generator used for the subsample
                     
     	Returns
     	-------
-        pd.DataFrame
+        pd.DataFrame or TestResult
+            the path followed (test and subsample) is recorded in the `path` column or the notes of the result
         """
-        report = ""
-        sample = np.array(sample)
-        np_types = [np.dtype(i) for i in [np.int32, np.int64, np.float32, np.float64]]
-        sample_dtypes = sample.dtype
-        if any([not t in np_types for t in [sample_dtypes]]):
-            raise Exception('Non numerical variables... Try using categorical_test method instead.')
-        df = pg.normality(sample)
-        result = True if df['pval'][0] >= alpha else False
-        if result:
-            report += "The null hypothesis is accepted, thus the data was  drawn from a normal distribution"
-        else:
-            report += "The alternative hypothesis is accepted, thus the data was not  drawn from a normal distribution. "
-        report += "Significance level considered = {},  test applied = {}, p-value = {}, test statistic = {}".format(alpha, method, df['pval'][0], df['W'][0])
-        df['report'] = report
+        sample = np.asarray(sample)
+        self.check_numeric([sample.dtype])
+        if sample.dtype.kind == 'f':
+            sample = sample[~np.isnan(sample)]
+        with self._phase('normality', len(sample)):
+            statistic, p_value, path = self._normality(sample[:, None], method, max_shapiro, seed)
+        result = TestResult('normality', path.split(' ')[0], statistic[0], p_value[0], alpha, len(sample), 
+                            "Path = {}. ".format(path))
+        if self.lightweight:
+            return result
+        df = pd.DataFrame({'W': statistic, 'pval': p_value, 'normal': p_value >= alpha, 'path': path})
+        df['report'] = result.report
         return df
-    
+
+    @instrumented
+    @cached
+    def normality_batch(self, data, alpha = 0.05, method = 'auto', max_shapiro = 5000, seed = 0):
+        """
+        Tests the null hypothesis that the data was drawn from a normal distribution for every column of data
+        
+    	Parameters
+    	----------            
+        data : pd.DataFrame or array_like
+                  Table of sample data without missing values, one sample per column.
+        alpha : float
+                               level of significance (default = 0.05)
+        method : string
+                 normality test to be applied, one of `shapiro`, `normaltest`, `jarque_bera` or `auto`
+        max_shapiro : int
+                 maximum number of observations given to Shapiro-Wilk
+        seed : int
+                 seed of the random number generator used for the subsample
+                    
+    	Returns
+    	-------
+        pd.DataFrame or ResultSet
+            one row per column with columns W, pval, normal and path
+        """
+        data = pd.DataFrame(data)
+        self.check_numeric(data.dtypes)
+        statistic, p_values, path = self._normality(data.to_numpy(dtype = np.float64), method, max_shapiro, seed)
+        if self.lightweight:
+            return ResultSet('normality', path.split(' ')[0], statistic, p_values, alpha, column = data.columns, path = path)
+        return pd.DataFrame({'W': statistic, 'pval': p_values, 'normal': p_values >= alpha, 'path': path}, 
+                            index = data.columns)
+
+    def _normality(self, values, method = 'auto', max_shapiro = 5000, seed = 0, chunk_size = 1_000_000):
+        """
+        Applies a normality test to every column of values, choosing the path from the number of observations
+        
+    	Parameters
+    	----------            
+        values : np.ndarray
+                  2-D array of sample data, one sample per column.
+        method : string
+                 normality test to be applied, one of `shapiro`, `normaltest`, `jarque_bera` or `auto`
+        max_shapiro : int
+                 maximum number of observations given to Shapiro-Wilk
+        seed : int
+                 seed of the random number generator used for the subsample
+        chunk_size : int
+                 number of rows per chunk of the moment based tests
+                    
+    	Returns
+    	-------
+        tuple
+            (statistics, p-values, path), one statistic and p-value per column
+        """
+        n = len(values)
+        if method == 'auto':
+            method = 'shapiro' if n <= max_shapiro else 'normaltest'
+        if method == 'shapiro':
+            path = 'shapiro'
+            if n > max_shapiro:
+                edges = np.arange(max_shapiro + 1) * n // max_shapiro
+                rng = np.random.default_rng(seed)
+                values = values[edges[:-1] + (rng.random(max_shapiro) * np.diff(edges)).astype(np.int64)]
+                path = 'shapiro on a stratified subsample of {} of {} observations (seed = {})'.format(max_shapiro, n, seed)
+            tests = [shapiro(values[:, i]) for i in range(values.shape[1])]
+            statistic = np.array([test[0] for test in tests], dtype = np.float64)
+            p_values = np.array([test[1] for test in tests], dtype = np.float64)
+            return statistic, p_values, path
+        elif method in ('normaltest', 'jarque_bera'):
+            moments = Moments()
+            for start in range(0, n, chunk_size):
+                moments.update(values[start:start + chunk_size])
+            statistic, p_values = moments.normaltest() if method == 'normaltest' else moments.jarque_bera()
+            return np.atleast_1d(statistic), np.atleast_1d(p_values), method + ' from streamed moments'
+        raise Exception('Invalid method. Choose one of `shapiro`, `normaltest`, `jarque_bera` or `auto`.')
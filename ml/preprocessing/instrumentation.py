@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import numpy as np
+import pandas as pd
+
+# shared no-op context returned by the phases of a Tester without profiler
+DISABLED = nullcontext()
+
+
+class Profiler:
+    """
+    Collects per-phase timers, call counters and input-size histograms of Tester calls. Phases are nested
+    spans opened with the phase context manager, every finished phase is also passed to the callback if one
+    is given. The results are summarized in a table or exported as a Chrome trace (chrome://tracing or Perfetto).
+    """
+
+    def __init__(self, callback = None, keep_events = True):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        callback : callable
+                  function called as callback(name, seconds, n) at the end of every phase
+        keep_events : bool
+                  if every phase is kept for the Chrome trace, otherwise only the aggregates are kept
+
+    	Returns
+    	-------
+        Profiler
+        """
+        self.callback = callback
+        self.keep_events = keep_events
+        self.reset()
+
+    def reset(self):
+        """
+        Discards everything collected so far
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        Profiler
+        """
+        self.origin = time.perf_counter()
+        self.events = []
+        self.timers = {}
+        self.counters = {}
+        self.sizes = {}
+        return self
+
+    @contextmanager
+    def phase(self, name, n = None):
+        """
+        Times the code run inside the context as the phase `name`
+
+    	Parameters
+    	----------
+        name : string
+                  name of the phase
+        n : int
+                  size of the input of the phase, counted in the input-size histogram
+
+    	Returns
+    	-------
+        context manager
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.record(name, start, time.perf_counter() - start, n)
+
+    def record(self, name, start, seconds, n = None):
+        """
+        Records a finished phase
+
+    	Parameters
+    	----------
+        name : string
+                  name of the phase
+        start : float
+                  time.perf_counter() at the start of the phase
+        seconds : float
+                  duration of the phase
+        n : int
+                  size of the input of the phase
+
+    	Returns
+    	-------
+        None
+        """
+        calls, total, longest = self.timers.get(name, (0, 0., 0.))
+        self.timers[name] = (calls + 1, total + seconds, max(longest, seconds))
+        if n is not None:
+            bucket = int(np.log10(n)) if n > 0 else -1
+            histogram = self.sizes.setdefault(name, {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        if self.keep_events:
+            self.events.append((name, start, seconds, n, threading.get_ident()))
+        if self.callback is not None:
+            self.callback(name, seconds, n)
+
+    def count(self, name, value = 1):
+        """
+        Increments the counter `name`
+
+    	Parameters
+    	----------
+        name : string
+                  name of the counter
+        value : int
+                  increment
+
+    	Returns
+    	-------
+        None
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """
+        Table of the phases sorted by total time, with the number of calls, total, mean and longest seconds
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        pd.DataFrame
+        """
+        df = pd.DataFrame([(name, calls, total, total / calls, longest) for name, (calls, total, longest) in self.timers.items()],
+                          columns = ['phase', 'calls', 'total', 'mean', 'max'])
+        return df.sort_values('total', ascending = False, ignore_index = True)
+
+    def size_histogram(self):
+        """
+        Number of calls of each phase by order of magnitude of the input size: size 0 counts inputs
+        from 1 to 9 rows, size 1 from 10 to 99 rows and so on, empty inputs are counted in size -1
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        pd.DataFrame
+        """
+        rows = [(name, bucket, calls) for name, histogram in self.sizes.items() for bucket, calls in sorted(histogram.items())]
+        return pd.DataFrame(rows, columns = ['phase', 'size', 'calls'])
+
+    def chrome_trace(self, path = None):
+        """
+        Phases in the Chrome trace event format, nested phases are shown as nested spans
+
+    	Parameters
+    	----------
+        path : string
+                  if given, the trace is also written to this JSON file
+
+    	Returns
+    	-------
+        dict
+        """
+        pid = os.getpid()
+        events = [{'name': name, 'ph': 'X', 'ts': (start - self.origin) * 1e6, 'dur': seconds * 1e6, 'pid': pid, 'tid': tid,
+                   'args': {} if n is None else {'n': int(n)}} for name, start, seconds, n, tid in self.events]
+        events += [{'name': name, 'ph': 'C', 'ts': 0, 'pid': pid, 'args': {name: value}} for name, value in self.counters.items()]
+        trace = {'traceEvents': events, 'displayTimeUnit': 'ms'}
+        if path is not None:
+            with open(path, 'w') as file:
+                json.dump(trace, file)
+        return trace
+
+
+def input_size(args):
+    """
+    Number of rows of the first argument of a call, None if it has no length
+    """
+    if args and hasattr(args[0], '__len__') and not isinstance(args[0], str):
+        return len(args[0])
+    return None
+
+
+def instrumented(method):
+    """
+    Decorator of Tester methods: when the Tester has a profiler, the call is timed as a phase named after
+    the method, with the length of its first argument as input size. Without profiler the method is called directly.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return method(self, *args, **kwargs)
+        with self.profiler.phase(method.__name__, input_size(args)):
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,186 @@
+import numpy as np
+from scipy.special import digamma
+
+METHODS = ['bonferroni', 'holm', 'fdr_bh', 'fdr_by']
+
+
+def adjust(p_values, method = 'fdr_bh', m = None):
+    """
+    Adjusts p-values for multiple comparisons with a single sort. Missing p-values are kept missing
+    and not counted as tests.
+
+	Parameters
+	----------
+    p_values : array_like
+              p-values of the tests
+    method : string
+              correction to be applied, one of `bonferroni`, `holm`, `fdr_bh` (Benjamini-Hochberg)
+              or `fdr_by` (Benjamini-Yekutieli)
+    m : int
+              total number of tests, when p_values only holds the smallest p-values of a larger batch.
+              Adjusted p-values are then exact for bonferroni and holm, and exact below alpha for
+              fdr_bh and fdr_by whenever every p-value that could be rejected is included
+
+	Returns
+	-------
+    np.ndarray
+        adjusted p-values, in the order of p_values
+    """
+    if not method in METHODS:
+        raise Exception('Invalid method. Choose one of `bonferroni`, `holm`, `fdr_bh` or `fdr_by`.')
+    p_values = np.asarray(p_values, dtype = np.float64)
+    adjusted = np.full(p_values.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    m = len(valid) if m is None else m
+    if not len(valid):
+        return adjusted
+    if method == 'bonferroni':
+        adjusted[valid] = np.minimum(p_values[valid] * m, 1)
+        return adjusted
+    order = valid[np.argsort(p_values[valid], kind = 'stable')]
+    ranks = np.arange(1, len(order) + 1)
+    ordered = p_values[order]
+    if method == 'holm':
+        ranked = np.maximum.accumulate(ordered * (m - ranks + 1))
+    else:
+        ranked = ordered * m / ranks
+        if method == 'fdr_by':
+            ranked *= _harmonic(m)
+        ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    adjusted[order] = np.minimum(ranked, 1)
+    return adjusted
+
+
+def _harmonic(m):
+    # exact sum for few tests, digamma otherwise so that huge totals of a streamed batch allocate nothing
+    if m <= 10 ** 6:
+        return (1 / np.arange(1, m + 1)).sum()
+    return float(digamma(m + 1) + np.euler_gamma)
+
+
+class StreamingCorrection:
+    """
+    Multiple testing correction for batches of p-values too large to hold at once, in two passes over the batches.
+    The first pass (observe) counts the p-values in a histogram with logarithmic bins and finds the largest
+    p-value that could still be rejected by Benjamini-Hochberg, which bounds every other method. The second pass
+    (collect) keeps only the p-values under that bound, which are the smallest p-values of all batches, so the
+    rejection threshold is exact. Decisions are then made batch by batch with decide.
+    """
+
+    def __init__(self, method = 'fdr_bh', alpha = 0.05, bins_per_decade = 100, min_exponent = -300):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        method : string
+                  correction to be applied, one of `bonferroni`, `holm`, `fdr_bh` or `fdr_by`
+        alpha : float
+                  level of significance (default = 0.05)
+        bins_per_decade : int
+                  resolution of the histogram of the first pass
+        min_exponent : int
+                  p-values below 10 ** min_exponent share the first bin
+
+    	Returns
+    	-------
+        StreamingCorrection
+        """
+        if not method in METHODS:
+            raise Exception('Invalid method. Choose one of `bonferroni`, `holm`, `fdr_bh` or `fdr_by`.')
+        self.method, self.alpha = method, alpha
+        self.edges = np.concatenate([[0.], np.logspace(min_exponent, 0, -min_exponent * bins_per_decade + 1)])
+        self.counts = np.zeros(len(self.edges) - 1, dtype = np.int64)
+        self.m = 0
+        self.bound = None
+        self.collected = []
+        self.cutoff = None
+
+    def observe(self, p_values):
+        """
+        First pass: counts a batch of p-values
+
+    	Parameters
+    	----------
+        p_values : array_like
+                  p-values of a batch of tests
+
+    	Returns
+    	-------
+        StreamingCorrection
+        """
+        p_values = np.asarray(p_values, dtype = np.float64)
+        p_values = p_values[~np.isnan(p_values)]
+        self.m += len(p_values)
+        bins = np.clip(np.searchsorted(self.edges, p_values, side = 'left') - 1, 0, len(self.counts) - 1)
+        self.counts += np.bincount(bins, minlength = len(self.counts))
+        self.bound = None
+        return self
+
+    def upper_bound(self):
+        """
+        Largest p-value that can be rejected, from the histogram of the first pass
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        float
+        """
+        if self.bound is None:
+            cumulative = np.cumsum(self.counts)
+            possible = np.flatnonzero((self.counts > 0) & (self.edges[:-1] <= cumulative * self.alpha / max(self.m, 1)))
+            self.bound = self.edges[possible[-1] + 1] if len(possible) else -1.
+        return self.bound
+
+    def collect(self, p_values):
+        """
+        Second pass: keeps the p-values of a batch that may be rejected
+
+    	Parameters
+    	----------
+        p_values : array_like
+                  p-values of a batch of tests, the same batches given to observe
+
+    	Returns
+    	-------
+        StreamingCorrection
+        """
+        p_values = np.asarray(p_values, dtype = np.float64)
+        self.collected.append(p_values[p_values <= self.upper_bound()])
+        self.cutoff = None
+        return self
+
+    def threshold(self):
+        """
+        Exact rejection threshold after both passes: a test is rejected when its p-value is at most the threshold
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        float
+        """
+        if self.cutoff is None:
+            candidates = np.concatenate(self.collected) if self.collected else np.empty(0)
+            rejected = candidates[adjust(candidates, self.method, self.m) < self.alpha]
+            self.cutoff = rejected.max() if len(rejected) else -1.
+        return self.cutoff
+
+    def decide(self, p_values):
+        """
+        Decisions for a batch of p-values after both passes
+
+    	Parameters
+    	----------
+        p_values : array_like
+                  p-values of a batch of tests
+
+    	Returns
+    	-------
+        np.ndarray
+            True where the null hypothesis is rejected
+        """
+        return np.asarray(p_values, dtype = np.float64) <= self.threshold()
@@ -0,0 +1,336 @@
+import os
+import numpy as np
+from scipy.stats import chi2, f, ncf, nct, ncx2, norm
+from scipy.stats import t as t_dist
+from ml.preprocessing.cache import fingerprint
+
+TESTS = ['correlation', 'chi2', 'ttest', 'mannwhitney', 'anova', 'kruskal']
+
+# smallest sample size (observations per group for group tests) with a defined power
+MIN_N = {'correlation': 5, 'chi2': 1, 'ttest': 2, 'mannwhitney': 2, 'anova': 2, 'kruskal': 2}
+
+# asymptotic relative efficiency of the rank tests with respect to the parametric tests under normality
+ARE = 3 / np.pi
+
+# interpolation grids already built or loaded, keyed by their parameters
+_grids = {}
+
+
+def power(test, effect, n, alpha = 0.05, alternative = 'two-sided', dof = 1, n_groups = 2):
+    """
+    Power of a test, vectorized over effect, n and alpha (which are broadcast together)
+
+	Parameters
+	----------
+    test : string
+              one of `correlation` (effect: Pearson r), `chi2` (effect: Cohen's w), `ttest` and `mannwhitney`
+              (effect: Cohen's d), `anova` and `kruskal` (effect: Cohen's f). The rank tests are approximated
+              by the parametric tests with the sample size scaled by their asymptotic relative efficiency
+    effect : float or array_like
+              effect size
+    n : int or array_like
+              total number of observations for `correlation` and `chi2`, observations per group otherwise
+    alpha : float or array_like
+              level of significance (default = 0.05)
+    alternative : string
+              one of `two-sided`, `greater` or `less`, only for `correlation`, `ttest` and `mannwhitney`
+    dof : int
+              degrees of freedom of `chi2`, (rows - 1) * (columns - 1)
+    n_groups : int
+              number of groups of `anova` and `kruskal`
+
+	Returns
+	-------
+    float or np.ndarray
+        power, nan where n is below the smallest sample size of the test
+    """
+    if not test in TESTS:
+        raise Exception('Invalid test. Choose one of `correlation`, `chi2`, `ttest`, `mannwhitney`, `anova` or `kruskal`.')
+    if not alternative in ('two-sided', 'greater', 'less'):
+        raise Exception('Invalid alternative. Choose one of `two-sided`, `greater` or `less`.')
+    if test in ('chi2', 'anova', 'kruskal') and alternative != 'two-sided':
+        raise Exception('Only the `two-sided` alternative is available for `chi2`, `anova` and `kruskal`.')
+    effect, n, alpha = np.broadcast_arrays(*[np.asarray(v, dtype = np.float64) for v in (effect, n, alpha)])
+    valid = n >= MIN_N[test]
+    n = np.where(valid, n, MIN_N[test])
+    if test in ('mannwhitney', 'kruskal'):
+        n = n * ARE
+    if alternative == 'two-sided':
+        effect = np.abs(effect)
+    elif alternative == 'less':
+        effect = -effect
+    sides = 2 if alternative == 'two-sided' else 1
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        if test == 'correlation':
+            dof_t = n - 2
+            critical = t_dist.ppf(1 - alpha / sides, dof_t)
+            z_critical = np.arctanh(np.sqrt(critical ** 2 / (critical ** 2 + dof_t)))
+            z = np.arctanh(np.clip(effect, -1 + 1e-12, 1 - 1e-12)) + effect / (2 * (n - 1))
+            result = norm.cdf((z - z_critical) * np.sqrt(n - 3))
+            if sides == 2:
+                result = result + norm.cdf((-z - z_critical) * np.sqrt(n - 3))
+        elif test == 'chi2':
+            result = ncx2.sf(chi2.isf(alpha, dof), dof, n * effect ** 2)
+        elif test in ('ttest', 'mannwhitney'):
+            dof_t = 2 * n - 2
+            nc = effect * np.sqrt(n / 2)
+            critical = t_dist.ppf(1 - alpha / sides, dof_t)
+            result = nct.sf(critical, dof_t, nc)
+            if sides == 2:
+                # the opposite tail is negligible for large noncentralities, where scipy returns nan for it
+                result = result + np.nan_to_num(nct.cdf(-critical, dof_t, nc), nan = 0.)
+        else:
+            dof1, dof2 = n_groups - 1, n_groups * (n - 1)
+            result = ncf.sf(f.isf(alpha, dof1, dof2), dof1, dof2, n_groups * n * effect ** 2)
+    return np.where(valid, np.clip(result, 0, 1), np.nan)[()]
+
+
+def sample_size(test, effect, power_target = 0.8, alpha = 0.05, alternative = 'two-sided', dof = 1, n_groups = 2,
+                max_n = 10 ** 9):
+    """
+    Smallest sample size reaching the target power, vectorized over effect, power_target and alpha. The sizes
+    are found with an integer bisection run on all scenarios at once, one vectorized power evaluation per step.
+
+	Parameters
+	----------
+    test : string
+              test, see power
+    effect : float or array_like
+              effect size
+    power_target : float or array_like
+              power to be reached (default = 0.8)
+    alpha : float or array_like
+              level of significance (default = 0.05)
+    alternative : string
+              one of `two-sided`, `greater` or `less`
+    dof : int
+              degrees of freedom of `chi2`
+    n_groups : int
+              number of groups of `anova` and `kruskal`
+    max_n : int
+              largest sample size searched
+
+	Returns
+	-------
+    float or np.ndarray
+        total number of observations for `correlation` and `chi2`, observations per group otherwise,
+        nan where the power is not reached with max_n observations
+    """
+    effect, target, alpha = np.broadcast_arrays(*[np.asarray(v, dtype = np.float64) for v in (effect, power_target, alpha)])
+    evaluate = lambda n: power(test, effect, n, alpha, alternative, dof, n_groups)
+    lo = np.full(effect.shape, float(MIN_N[test]))
+    hi = lo.copy()
+    short = ~(evaluate(hi) >= target)
+    done = ~short
+    while short.any() and (hi[short] < max_n).any():
+        lo = np.where(short, hi, lo)
+        hi = np.where(short, np.minimum(hi * 2, max_n), hi)
+        short = short & ~(evaluate(hi) >= target) & (hi < max_n)
+    reached = evaluate(hi) >= target
+    while (hi - lo > 1).any():
+        mid = np.floor((lo + hi) / 2)
+        ok = evaluate(mid) >= target
+        hi, lo = np.where(ok, mid, hi), np.where(ok, lo, mid)
+    return np.where(done, MIN_N[test], np.where(reached, hi, np.nan))[()]
+
+
+def effect_size(test, statistic, n, n_groups = 2):
+    """
+    Effect size estimated from the statistic of a test result, in the scale used by power
+
+	Parameters
+	----------
+    test : string
+              one of `correlation`, `chi2`, `ttest` or `anova`
+    statistic : float or array_like
+              statistic of the test: r, chi-squared, t or F
+    n : int or array_like
+              total number of observations for `correlation` and `chi2`, observations per group otherwise
+    n_groups : int
+              number of groups of `anova`
+
+	Returns
+	-------
+    float or np.ndarray
+    """
+    statistic, n = np.asarray(statistic, dtype = np.float64), np.asarray(n, dtype = np.float64)
+    if test == 'correlation':
+        return statistic[()]
+    elif test == 'chi2':
+        return np.sqrt(statistic / n)[()]
+    elif test == 'ttest':
+        return (statistic * np.sqrt(2 / n))[()]
+    elif test == 'anova':
+        return np.sqrt(statistic * (n_groups - 1) / (n_groups * (n - 1)))[()]
+    raise Exception('Invalid test. Choose one of `correlation`, `chi2`, `ttest` or `anova`.')
+
+
+class PowerGrid:
+    """
+    Power of a test precomputed over a grid of effect sizes and sample sizes, so that power and sample size
+    queries are interpolations (linear in the logarithms of the effect and of the sample size). Grids are
+    stored on disk and loaded on the next use. Queries outside the grid are computed exactly. Interpolated
+    powers are within about 1e-3 of the exact ones and sample sizes within one or two observations.
+    """
+
+    def __init__(self, test, alpha = 0.05, alternative = 'two-sided', dof = 1, n_groups = 2, effects = None,
+                 sizes = None, directory = None):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        test : string
+                  test, see power
+        alpha : float
+                  level of significance (default = 0.05)
+        alternative : string
+                  one of `two-sided`, `greater` or `less`
+        dof : int
+                  degrees of freedom of `chi2`
+        n_groups : int
+                  number of groups of `anova` and `kruskal`
+        effects : array_like
+                  increasing positive effect sizes of the grid
+        sizes : array_like
+                  increasing sample sizes of the grid
+        directory : string
+                  directory where the grid is stored, if None it is only kept in memory
+
+    	Returns
+    	-------
+        PowerGrid
+        """
+        self.test, self.alpha, self.alternative, self.dof, self.n_groups = test, alpha, alternative, dof, n_groups
+        # the table holds the power for effects in the direction of the alternative, both one-sided
+        # alternatives share the table of `greater` and the sign of the effect is applied by _direction only
+        canonical = 'two-sided' if alternative == 'two-sided' else 'greater'
+        largest = 0.995 if test == 'correlation' else 5.
+        self.effects = np.geomspace(0.005, largest, 256) if effects is None else np.asarray(effects, dtype = np.float64)
+        self.sizes = (np.unique(np.geomspace(MIN_N[test], 10 ** 7, 512).round()) if sizes is None
+                      else np.asarray(sizes, dtype = np.float64))
+        # the version tells apart grids stored before the nan fix of the two-sided t power
+        key = fingerprint('power grid', 2, test, alpha, canonical, dof, n_groups, self.effects, self.sizes)
+        path = None if directory is None else os.path.join(directory, key + '.npy')
+        if path is not None and os.path.exists(path):
+            self.table = np.load(path)
+        else:
+            self.table = power(test, self.effects[:, None], self.sizes[None, :], alpha, canonical, dof, n_groups)
+            if path is not None:
+                os.makedirs(directory, exist_ok = True)
+                tmp = path + '.{}.tmp'.format(os.getpid())
+                with open(tmp, 'wb') as file:
+                    np.save(file, self.table)
+                os.replace(tmp, path)
+        self.log_effects, self.log_sizes = np.log(self.effects), np.log(self.sizes)
+
+    def _direction(self, effect):
+        if self.alternative == 'two-sided':
+            return np.abs(effect)
+        return -effect if self.alternative == 'less' else effect
+
+    def _bracket(self, log_values, log_grid):
+        # index of the upper grid neighbour and interpolation weight of every value
+        upper = np.clip(np.searchsorted(log_grid, log_values), 1, len(log_grid) - 1)
+        return upper, (log_values - log_grid[upper - 1]) / (log_grid[upper] - log_grid[upper - 1])
+
+    def _curves(self, effect):
+        # power over the grid sizes for every effect, interpolated between the two nearest grid effects
+        upper, weight = self._bracket(np.log(np.clip(effect, self.effects[0], self.effects[-1])), self.log_effects)
+        return (1 - weight[:, None]) * self.table[upper - 1] + weight[:, None] * self.table[upper]
+
+    def power(self, effect, n):
+        """
+        Power of the test, vectorized over effect and n
+
+    	Parameters
+    	----------
+        effect : float or array_like
+                  effect size
+        n : int or array_like
+                  sample size, see power
+
+    	Returns
+    	-------
+        float or np.ndarray
+        """
+        effect, n = np.broadcast_arrays(np.asarray(effect, dtype = np.float64), np.asarray(n, dtype = np.float64))
+        shape, effect, n = effect.shape, effect.ravel(), n.ravel()
+        directed = self._direction(effect)
+        inside = ((directed >= self.effects[0]) & (directed <= self.effects[-1]) &
+                  (n >= self.sizes[0]) & (n <= self.sizes[-1]))
+        result = np.empty(len(effect))
+        if inside.any():
+            row, row_weight = self._bracket(np.log(directed[inside]), self.log_effects)
+            col, col_weight = self._bracket(np.log(n[inside]), self.log_sizes)
+            low = (1 - col_weight) * self.table[row - 1, col - 1] + col_weight * self.table[row - 1, col]
+            high = (1 - col_weight) * self.table[row, col - 1] + col_weight * self.table[row, col]
+            result[inside] = (1 - row_weight) * low + row_weight * high
+        if not inside.all():
+            result[~inside] = power(self.test, effect[~inside], n[~inside], self.alpha, self.alternative,
+                                    self.dof, self.n_groups)
+        return result.reshape(shape)[()]
+
+    def sample_size(self, effect, power_target = 0.8):
+        """
+        Smallest sample size reaching the target power, vectorized over effect and power_target
+
+    	Parameters
+    	----------
+        effect : float or array_like
+                  effect size
+        power_target : float or array_like
+                  power to be reached (default = 0.8)
+
+    	Returns
+    	-------
+        float or np.ndarray
+            sample size, see sample_size
+        """
+        effect, target = np.broadcast_arrays(np.asarray(effect, dtype = np.float64),
+                                             np.asarray(power_target, dtype = np.float64))
+        shape, effect, target = effect.shape, effect.ravel(), target.ravel()
+        directed = self._direction(effect)
+        curves = self._curves(directed)
+        reached = curves >= target[:, None]
+        first = reached.argmax(axis = 1)
+        inside = (directed >= self.effects[0]) & (directed <= self.effects[-1]) & reached.any(axis = 1) & (first > 0)
+        result = np.empty(len(effect))
+        if inside.any():
+            rows, upper = np.flatnonzero(inside), first[inside]
+            low, high = curves[rows, upper - 1], curves[rows, upper]
+            weight = (target[inside] - low) / (high - low)
+            result[inside] = np.ceil(np.exp((1 - weight) * self.log_sizes[upper - 1] + weight * self.log_sizes[upper]))
+        if not inside.all():
+            result[~inside] = sample_size(self.test, effect[~inside], target[~inside], self.alpha, self.alternative,
+                                          self.dof, self.n_groups)
+        return result.reshape(shape)[()]
+
+
+def grid(test, alpha = 0.05, alternative = 'two-sided', dof = 1, n_groups = 2, directory = None):
+    """
+    Interpolation grid of a test, built or loaded once per process
+
+	Parameters
+	----------
+    test : string
+              test, see power
+    alpha : float
+              level of significance (default = 0.05)
+    alternative : string
+              one of `two-sided`, `greater` or `less`
+    dof : int
+              degrees of freedom of `chi2`
+    n_groups : int
+              number of groups of `anova` and `kruskal`
+    directory : string
+              directory where grids are stored, if None they are only kept in memory
+
+	Returns
+	-------
+    PowerGrid
+    """
+    key = (test, alpha, alternative, dof, n_groups, directory)
+    if not key in _grids:
+        _grids[key] = PowerGrid(test, alpha, alternative, dof, n_groups, directory = directory)
+    return _grids[key]
@@ -0,0 +1,322 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy.stats import beta
+
+
+def prepare(statistic, sample1, sample2):
+    """
+    Converts the samples to the arrays used to evaluate statistic on resamples
+
+	Parameters
+	----------
+    statistic : string
+              one of `correlation` (paired quantitative samples), `mean_difference`
+              (two independent quantitative samples) or `chi2` (paired categorical samples)
+    sample1, sample2 : array_like
+              Arrays of sample data.
+
+	Returns
+	-------
+    dict
+    """
+    if statistic == 'correlation':
+        x, y = np.asarray(sample1, dtype = np.float64), np.asarray(sample2, dtype = np.float64)
+        if len(x) != len(y):
+            raise Exception('Samples must have the same length.')
+        x, y = (x - x.mean()) / x.std(), (y - y.mean()) / y.std()
+        return {'statistic': statistic, 'x': x, 'y': y}
+    elif statistic == 'mean_difference':
+        x, y = np.asarray(sample1, dtype = np.float64), np.asarray(sample2, dtype = np.float64)
+        return {'statistic': statistic, 'values': np.concatenate([x, y]), 'n1': len(x)}
+    elif statistic == 'chi2':
+        if len(sample1) != len(sample2):
+            raise Exception('Samples must have the same length.')
+        codes1, uniques1 = pd.factorize(np.asarray(sample1))
+        codes2, uniques2 = pd.factorize(np.asarray(sample2))
+        valid = (codes1 >= 0) & (codes2 >= 0)
+        codes1, codes2 = codes1[valid], codes2[valid]
+        r, c = len(uniques1), len(uniques2)
+        expected = np.outer(np.bincount(codes1, minlength = r), np.bincount(codes2, minlength = c)) / len(codes1)
+        return {'statistic': statistic, 'codes1': codes1.astype(np.int64), 'codes2': codes2.astype(np.int64),
+                'shape': (r, c), 'expected': expected}
+    raise Exception('Invalid statistic. Choose one of `correlation`, `mean_difference` or `chi2`.')
+
+
+def observed(data):
+    """
+    Value of the statistic on the original samples
+
+	Parameters
+	----------
+    data : dict
+              arrays returned by prepare
+
+	Returns
+	-------
+    float
+    """
+    return permuted(data, np.arange(size(data))[None, :])[0]
+
+
+def size(data):
+    """
+    Number of observations that are permuted or resampled
+    """
+    if data['statistic'] == 'correlation':
+        return len(data['x'])
+    elif data['statistic'] == 'mean_difference':
+        return len(data['values'])
+    return len(data['codes1'])
+
+
+def permuted(data, indices):
+    """
+    Evaluates the statistic for a block of permutations at once
+
+	Parameters
+	----------
+    data : dict
+              arrays returned by prepare
+    indices : np.ndarray
+              index matrix with one permutation per row
+
+	Returns
+	-------
+    np.ndarray
+        one value per permutation
+    """
+    if data['statistic'] == 'correlation':
+        return data['y'][indices] @ data['x'] / len(data['x'])
+    elif data['statistic'] == 'mean_difference':
+        values, n1 = data['values'], data['n1']
+        n2 = len(values) - n1
+        sum1 = values[indices[:, :n1]].sum(axis = 1)
+        return sum1 / n1 - (values.sum() - sum1) / n2
+    r, c = data['shape']
+    expected = data['expected']
+    block = len(indices)
+    cells = data['codes1'] * c + data['codes2'][indices] + (np.arange(block) * r * c)[:, None]
+    tables = np.bincount(cells.ravel(), minlength = block * r * c).reshape(block, r, c)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return np.nansum((tables - expected) ** 2 / expected, axis = (1, 2))
+
+
+def bootstrapped(data, rng, block):
+    """
+    Evaluates the statistic for a block of bootstrap resamples at once
+
+	Parameters
+	----------
+    data : dict
+              arrays returned by prepare
+    rng : np.random.Generator
+              random number generator
+    block : int
+              number of resamples
+
+	Returns
+	-------
+    np.ndarray
+        one value per resample
+    """
+    if data['statistic'] == 'correlation':
+        n = len(data['x'])
+        indices = rng.integers(0, n, (block, n))
+        x, y = data['x'][indices], data['y'][indices]
+        x -= x.mean(axis = 1, keepdims = True)
+        y -= y.mean(axis = 1, keepdims = True)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return (x * y).sum(axis = 1) / np.sqrt((x * x).sum(axis = 1) * (y * y).sum(axis = 1))
+    elif data['statistic'] == 'mean_difference':
+        values, n1 = data['values'], data['n1']
+        n2 = len(values) - n1
+        sample1 = values[rng.integers(0, n1, (block, n1))].mean(axis = 1)
+        sample2 = values[n1 + rng.integers(0, n2, (block, n2))].mean(axis = 1)
+        return sample1 - sample2
+    raise Exception('Bootstrap is only available for `correlation` and `mean_difference`.')
+
+
+def exceedances(data, value, alternative, seeds, blocks):
+    """
+    Counts the permutations whose statistic is at least as extreme as value, block by block
+
+	Parameters
+	----------
+    data : dict
+              arrays returned by prepare
+    value : float
+              observed statistic
+    alternative : string
+              one of `two-sided`, `greater` or `less`
+    seeds : list
+              one np.random.SeedSequence per block
+    blocks : list
+              number of permutations of each block
+
+	Returns
+	-------
+    int
+    """
+    data = _shared_data if data is None else data
+    n = size(data)
+    count = 0
+    for seed, block in zip(seeds, blocks):
+        rng = np.random.default_rng(seed)
+        indices = rng.permuted(np.broadcast_to(np.arange(n), (block, n)), axis = 1)
+        statistics = permuted(data, indices)
+        if alternative == 'two-sided':
+            count += int((np.abs(statistics) >= abs(value) - 1e-12).sum())
+        elif alternative == 'greater':
+            count += int((statistics >= value - 1e-12).sum())
+        else:
+            count += int((statistics <= value + 1e-12).sum())
+    return count
+
+
+def _share_data(data):
+    """
+    Process pool initializer: keeps the prepared arrays in the worker so they are sent only once
+    """
+    global _shared_data
+    _shared_data = data
+
+
+def run_blocks(function, args, seeds, blocks, alpha = 0.05, early_stop = True, confidence = 0.999,
+               executor = None, n_jobs = 1, worker_args = None):
+    """
+    Driver of the Monte Carlo tests: counts the exceedances of block after block, where function(*args, seeds, blocks)
+    returns the count of the given blocks. With an executor, n_jobs blocks are evaluated at a time, but their counts
+    are added in the order of the blocks and the stopping rule is checked after each one, so the blocks used, and
+    the result, do not depend on n_jobs.
+
+	Parameters
+	----------
+    function : callable
+              counts the exceedances of a list of blocks
+    args : tuple
+              first arguments of function
+    seeds : list
+              one np.random.SeedSequence per block
+    blocks : list
+              number of resamples of each block
+    alpha : float
+              level of significance used for early stopping
+    early_stop : bool
+              if the simulation stops once a Clopper-Pearson interval of the p-value excludes alpha
+    confidence : float
+              confidence of the interval used for early stopping
+    executor : concurrent.futures.Executor
+              executor evaluating blocks in parallel, if None blocks are evaluated in this process
+    n_jobs : int
+              number of blocks submitted to the executor at a time
+    worker_args : tuple
+              first arguments of function in the executor, if different from args
+
+	Returns
+	-------
+    tuple
+        (number of exceedances, number of resamples evaluated)
+    """
+    count, done, start = 0, 0, 0
+    wave = 1 if executor is None else max(1, n_jobs)
+    tail = (1 - confidence) / 2
+    while start < len(blocks):
+        stop = min(start + wave, len(blocks))
+        if executor is None:
+            counts = [function(*args, seeds[start:stop], blocks[start:stop])]
+        else:
+            worker_args = args if worker_args is None else worker_args
+            counts = executor.map(function, *[[arg] * (stop - start) for arg in worker_args],
+                                  [[s] for s in seeds[start:stop]], [[b] for b in blocks[start:stop]])
+        for block, block_count in zip(blocks[start:stop], counts):
+            count += block_count
+            done += block
+            if early_stop:
+                lower = beta.ppf(tail, count, done - count + 1) if count else 0.
+                upper = beta.ppf(1 - tail, count + 1, done - count) if count < done else 1.
+                if upper < alpha or lower > alpha:
+                    return count, done
+        start = stop
+    return count, done
+
+
+def permutation_test(data, alternative = 'two-sided', n_resamples = 10000, alpha = 0.05, seed = None,
+                     early_stop = True, confidence = 0.999, memory_budget = 2 ** 27, n_jobs = 1):
+    """
+    Monte Carlo permutation test. Permutations are generated as index matrices in blocks that fit in
+    memory_budget bytes and the statistic is evaluated over the whole block at once. Block i always uses
+    the i-th child of the seed and early stopping is checked block by block in order (see run_blocks),
+    so results do not depend on n_jobs.
+
+	Parameters
+	----------
+    data : dict
+              arrays returned by prepare
+    alternative : string
+              one of `two-sided`, `greater` or `less`
+    n_resamples : int
+              maximum number of permutations
+    alpha : float
+              level of significance used for early stopping
+    seed : int
+              seed of the random number generator
+    early_stop : bool
+              if the test stops once a Clopper-Pearson interval of the p-value excludes alpha
+    confidence : float
+              confidence of the interval used for early stopping
+    memory_budget : int
+              approximate number of bytes used by a block of index matrices
+    n_jobs : int
+              number of processes evaluating blocks
+
+	Returns
+	-------
+    tuple
+        (p-value, number of permutations evaluated)
+    """
+    if data['statistic'] == 'chi2':
+        alternative = 'greater'
+    value = observed(data)
+    block = int(max(1, min(n_resamples, memory_budget // (16 * size(data)))))
+    blocks = [block] * (n_resamples // block) + ([n_resamples % block] if n_resamples % block else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+    executor = ProcessPoolExecutor(max_workers = n_jobs, initializer = _share_data,
+                                   initargs = (data,)) if n_jobs > 1 else None
+    try:
+        count, done = run_blocks(exceedances, (data, value, alternative), seeds, blocks, alpha, early_stop, confidence,
+                                 executor, n_jobs, worker_args = (None, value, alternative))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures = True)
+    return (count + 1) / (done + 1), done
+
+
+def bootstrap(data, n_resamples = 10000, alpha = 0.05, seed = None, memory_budget = 2 ** 27):
+    """
+    Percentile bootstrap of the statistic, with resamples generated in blocks that fit in memory_budget bytes
+
+	Parameters
+	----------
+    data : dict
+              arrays returned by prepare
+    n_resamples : int
+              number of resamples
+    alpha : float
+              the interval has confidence 1 - alpha
+    seed : int
+              seed of the random number generator
+    memory_budget : int
+              approximate number of bytes used by a block of resamples
+
+	Returns
+	-------
+    tuple
+        (standard error, lower bound, upper bound)
+    """
+    rng = np.random.default_rng(seed)
+    block = int(max(1, min(n_resamples, memory_budget // (24 * size(data)))))
+    statistics = np.concatenate([bootstrapped(data, rng, min(block, n_resamples - start))
+                                 for start in range(0, n_resamples, block)])
+    lower, upper = np.nanquantile(statistics, [alpha / 2, 1 - alpha / 2])
+    return np.nanstd(statistics, ddof = 1), lower, upper
@@ -0,0 +1,262 @@
+import numpy as np
+import pandas as pd
+from ml.preprocessing.multiple_testing import adjust
+
+REPORTS = {'correlation': ("The alternative hypothesis is accepted, thus there is correlation between the samples. ",
+                           "The null hypothesis is accepted, thus there is no correlation between the samples. "),
+           'dependency': ("The null hypothesis is rejected, thus there is evidence of dependency between the samples. ",
+                          "The null hypothesis is not rejected, thus there is no evidence of dependency between the samples. "),
+           'normality': ("The alternative hypothesis is accepted, thus the data was not  drawn from a normal distribution. ",
+                         "The null hypothesis is accepted, thus the data was  drawn from a normal distribution. "),
+           'difference': ("The null hypothesis is rejected, thus there is evidence of difference between the groups. ",
+                          "The null hypothesis is not rejected, thus there is no evidence of difference between the groups. ")}
+
+
+def render(hypothesis, method, statistic, p_value, alpha, notes = ''):
+    """
+    Renders the report of a test result
+
+	Parameters
+	----------
+    hypothesis : string
+              family of the test, one of the keys of REPORTS
+    method : string
+              test applied
+    statistic : float
+              test statistic
+    p_value : float
+              p-value of the test
+    alpha : float
+              level of significance
+    notes : string
+              checks made before the test, placed at the start of the report
+
+	Returns
+	-------
+    string
+    """
+    rejected, accepted = REPORTS[hypothesis]
+    report = notes + (rejected if p_value < alpha else accepted)
+    return report + "Significance level considered = {},  test applied = {}, p-value = {}, test statistic = {}. ".format(
+        alpha, method, p_value, statistic)
+
+
+class TestResult:
+    """
+    Result of a single hypothesis test. The report is only rendered when it is accessed.
+    """
+    __slots__ = ('hypothesis', 'method', 'statistic', 'p_value', 'alpha', 'n', 'notes')
+
+    def __init__(self, hypothesis, method, statistic, p_value, alpha, n = None, notes = ''):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        hypothesis : string
+                  family of the test, one of `correlation`, `dependency`, `normality` or `difference`
+        method : string
+                  test applied
+        statistic : float
+                  test statistic
+        p_value : float
+                  p-value of the test
+        alpha : float
+                  level of significance
+        n : int
+                  number of observations
+        notes : string
+                  checks made before the test
+
+    	Returns
+    	-------
+        TestResult
+        """
+        self.hypothesis = hypothesis
+        self.method = method
+        self.statistic = statistic
+        self.p_value = p_value
+        self.alpha = alpha
+        self.n = n
+        self.notes = notes
+
+    @property
+    def decision(self):
+        """
+        True if the null hypothesis is rejected
+        """
+        return bool(self.p_value < self.alpha)
+
+    @property
+    def report(self):
+        return render(self.hypothesis, self.method, self.statistic, self.p_value, self.alpha, self.notes)
+
+    def copy(self):
+        """
+        Copy of the result that can be modified without changing this one
+        """
+        return TestResult(self.hypothesis, self.method, self.statistic, self.p_value, self.alpha, self.n, self.notes)
+
+    def to_frame(self):
+        """
+        Converts the result to a one row DataFrame
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        pd.DataFrame
+        """
+        return pd.DataFrame([(self.method, self.n, self.statistic, self.p_value, self.alpha, self.decision, self.report)],
+                            columns = ['test', 'n', 'statistic', 'p_value', 'alpha', 'reject', 'report'])
+
+    def __repr__(self):
+        return "TestResult(method={!r}, statistic={}, p_value={}, alpha={}, decision={})".format(
+            self.method, self.statistic, self.p_value, self.alpha, self.decision)
+
+
+class ResultSet:
+    """
+    Batch of test results of the same family stored column by column in arrays. Extra columns,
+    such as the names of the samples tested, are kept alongside. Converted to a DataFrame only on request.
+    """
+
+    def __init__(self, hypothesis, method, statistic, p_value, alpha, p_adjusted = None, **columns):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        hypothesis : string
+                  family of the tests, one of `correlation`, `dependency`, `normality` or `difference`
+        method : array_like or string
+                  test applied to each result
+        statistic, p_value : array_like
+                  test statistics and p-values
+        alpha : float
+                  level of significance
+        p_adjusted : array_like
+                  p-values adjusted for multiple testing, used for the decisions when given
+        columns : array_like
+                  extra columns, one value per result
+
+    	Returns
+    	-------
+        ResultSet
+        """
+        self.p_adjusted = None if p_adjusted is None else np.asarray(p_adjusted, dtype = np.float64)
+        self.hypothesis = hypothesis
+        self.statistic = np.asarray(statistic, dtype = np.float64)
+        self.p_value = np.asarray(p_value, dtype = np.float64)
+        self.method = np.broadcast_to(np.asarray(method, dtype = object), self.p_value.shape)
+        self.alpha = alpha
+        self.columns = {name: np.asarray(values) for name, values in columns.items()}
+
+    @classmethod
+    def from_results(cls, results, **columns):
+        """
+        Collects single results of the same family into a ResultSet
+
+    	Parameters
+    	----------
+        results : list
+                  TestResult objects
+        columns : array_like
+                  extra columns, one value per result
+
+    	Returns
+    	-------
+        ResultSet
+        """
+        if not results:
+            raise Exception('At least one result is needed.')
+        return cls(results[0].hypothesis, [r.method for r in results], [r.statistic for r in results],
+                   [r.p_value for r in results], results[0].alpha, **columns)
+
+    @property
+    def decision(self):
+        """
+        True where the null hypothesis is rejected
+        """
+        return (self.p_value if self.p_adjusted is None else self.p_adjusted) < self.alpha
+
+    def adjust(self, method = 'fdr_bh'):
+        """
+        Adjusts the p-values of the batch for multiple comparisons. The batch is not modified, a copy whose
+        decisions use the adjusted p-values is returned
+
+    	Parameters
+    	----------
+        method : string
+                  correction to be applied, one of `bonferroni`, `holm`, `fdr_bh` or `fdr_by`
+
+    	Returns
+    	-------
+        ResultSet
+        """
+        adjusted = self.copy()
+        adjusted.p_adjusted = adjust(self.p_value, method)
+        return adjusted
+
+    def copy(self):
+        """
+        Copy of the batch that can be modified without changing this one
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        ResultSet
+        """
+        return ResultSet(self.hypothesis, self.method.copy(), self.statistic.copy(), self.p_value.copy(), self.alpha,
+                         None if self.p_adjusted is None else self.p_adjusted.copy(),
+                         **{name: values.copy() for name, values in self.columns.items()})
+
+    def __len__(self):
+        return len(self.p_value)
+
+    def __getitem__(self, i):
+        return TestResult(self.hypothesis, self.method[i], self.statistic[i], self.p_value[i], self.alpha)
+
+    def reports(self):
+        """
+        Renders the report of every result
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        list
+        """
+        return [render(self.hypothesis, m, s, p, self.alpha) for m, s, p in zip(self.method, self.statistic, self.p_value)]
+
+    def to_frame(self, report = False):
+        """
+        Converts the results to a DataFrame, one row per result
+
+    	Parameters
+    	----------
+        report : bool
+                  if the rendered reports should be included
+
+    	Returns
+    	-------
+        pd.DataFrame
+        """
+        df = pd.DataFrame(self.columns)
+        df['test'] = self.method
+        df['statistic'] = self.statistic
+        df['p_value'] = self.p_value
+        if self.p_adjusted is not None:
+            df['p_adjusted'] = self.p_adjusted
+        df['reject'] = self.decision
+        if report:
+            df['report'] = self.reports()
+        return df
+
+    def __repr__(self):
+        return "ResultSet({} {} tests, {} rejected at alpha={})".format(len(self), self.hypothesis,
+                                                                       int(self.decision.sum()), self.alpha)
@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+from ml.preprocessing.results import TestResult
+from ml.preprocessing.streaming import Comoments
+
+
+class SequentialCorrelation:
+    """
+    Always-valid test of the null hypothesis that there is no correlation between two quantitative samples
+    observed in batches. Running co-moments give the Pearson r, whose Fisher z is tested with a normal
+    mixture sequential probability ratio test (mSPRT). The p-value and the confidence sequence stay valid
+    however many times they are checked, so the test can be looked at after every batch.
+    """
+
+    def __init__(self, alpha = 0.05, tau = 0.1):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        alpha : float
+                  level of significance (default = 0.05)
+        tau : float
+                  standard deviation of the normal mixture over the Fisher z of the correlation,
+                  the test is most powerful for effects of about this size
+
+    	Returns
+    	-------
+        SequentialCorrelation
+        """
+        self.alpha = alpha
+        self.tau = tau
+        self.comoments = Comoments()
+        self.p_value = 1.
+        self.batches = 0
+
+    def update(self, sample1, sample2):
+        """
+        Adds a batch of paired observations, in time proportional to the size of the batch
+
+    	Parameters
+    	----------
+        sample1, sample2 : array_like
+                  Arrays of sample data with the same length.
+
+    	Returns
+    	-------
+        SequentialCorrelation
+        """
+        self.comoments.update(sample1, sample2)
+        self.batches += 1
+        if self.comoments.n > 3:
+            self.p_value = min(self.p_value, 1 / self.likelihood_ratio())
+        return self
+
+    def likelihood_ratio(self, z0 = 0.):
+        """
+        Mixture likelihood ratio of the observations against the correlation with Fisher z equal to z0
+
+    	Parameters
+    	----------
+        z0 : float
+                  Fisher z of the correlation under the null hypothesis
+
+    	Returns
+    	-------
+        float
+        """
+        variance, tau2 = 1 / (self.comoments.n - 3), self.tau ** 2
+        z = np.arctanh(np.clip(self.comoments.r, -1 + 1e-15, 1 - 1e-15))
+        log_ratio = 0.5 * np.log(variance / (variance + tau2)) + tau2 * (z - z0) ** 2 / (2 * variance * (variance + tau2))
+        return float(np.exp(min(log_ratio, 700)))
+
+    def confidence_sequence(self):
+        """
+        Bounds of the correlation that remain valid with confidence 1 - alpha at every batch
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        tuple
+            (lower, upper)
+        """
+        if self.comoments.n <= 3:
+            return -1., 1.
+        variance, tau2 = 1 / (self.comoments.n - 3), self.tau ** 2
+        z = np.arctanh(np.clip(self.comoments.r, -1 + 1e-15, 1 - 1e-15))
+        width = np.sqrt(2 * variance * (variance + tau2) / tau2 *
+                        (np.log(1 / self.alpha) + 0.5 * np.log((variance + tau2) / variance)))
+        return float(np.tanh(z - width)), float(np.tanh(z + width))
+
+    def result(self):
+        """
+        Current state of the test
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        TestResult
+        """
+        lower, upper = self.confidence_sequence()
+        notes = "Always-valid test after {} batches, confidence sequence of r = [{}, {}]. ".format(self.batches, lower, upper)
+        return TestResult('correlation', 'sequential pearson', self.comoments.r, self.p_value, self.alpha,
+                          self.comoments.n, notes)
+
+
+class SequentialIndependence:
+    """
+    Always-valid test of the null hypothesis that two categorical samples observed in batches are not dependent.
+    Contingency counts are updated with each batch. The e-process is the likelihood of the observations under
+    the sequential Krichevsky-Trofimov (add one half) estimate of the joint distribution, divided by their
+    maximum likelihood under independence (universal inference). Its inverse is an always-valid p-value.
+    """
+
+    def __init__(self, rows, cols, alpha = 0.05):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        rows, cols : list
+                  categories of each sample, every category that may appear must be listed
+        alpha : float
+                  level of significance (default = 0.05)
+
+    	Returns
+    	-------
+        SequentialIndependence
+        """
+        self.rows, self.cols = pd.Index(rows), pd.Index(cols)
+        self.alpha = alpha
+        self.counts = np.zeros((len(self.rows), len(self.cols)))
+        self.log_predictive = 0.
+        self.max_log_e = 0.
+        self.batches = 0
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    def update(self, sample1, sample2):
+        """
+        Adds a batch of paired observations, in time proportional to the size of the batch plus the size of the table
+
+    	Parameters
+    	----------
+        sample1, sample2 : array_like
+                  Arrays of categorical sample data with the same length.
+
+    	Returns
+    	-------
+        SequentialIndependence
+        """
+        codes1, codes2 = self.rows.get_indexer(np.asarray(sample1)), self.cols.get_indexer(np.asarray(sample2))
+        if (codes1 < 0).any() or (codes2 < 0).any():
+            raise Exception('Unknown category, every category must be given to the constructor.')
+        cells = codes1 * len(self.cols) + codes2
+        order = np.argsort(cells, kind = 'stable')
+        sorted_cells = cells[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(sorted_cells)) + 1]
+        occurrence = np.empty(len(cells))
+        occurrence[order] = np.arange(len(cells)) - np.repeat(starts, np.diff(np.r_[starts, len(cells)]))
+        seen = self.counts.ravel()[cells] + occurrence
+        total = self.n + np.arange(len(cells))
+        self.log_predictive += (np.log(seen + 0.5) - np.log(total + 0.5 * self.counts.size)).sum()
+        self.counts += np.bincount(cells, minlength = self.counts.size).reshape(self.counts.shape)
+        self.batches += 1
+        self.max_log_e = max(self.max_log_e, self.log_predictive - self._log_null())
+        return self
+
+    def _log_null(self):
+        n = self.counts.sum()
+        rows, cols = self.counts.sum(axis = 1), self.counts.sum(axis = 0)
+        rows, cols = rows[rows > 0], cols[cols > 0]
+        return (rows * np.log(rows / n)).sum() + (cols * np.log(cols / n)).sum()
+
+    @property
+    def p_value(self):
+        return float(min(1., np.exp(-self.max_log_e)))
+
+    def result(self):
+        """
+        Current state of the test
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        TestResult
+        """
+        notes = "Always-valid test after {} batches. ".format(self.batches)
+        return TestResult('dependency', 'sequential likelihood ratio', float(np.exp(min(self.max_log_e, 700))),
+                          self.p_value, self.alpha, self.n, notes)
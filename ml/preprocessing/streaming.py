@@ -0,0 +1,369 @@
+import numpy as np
+from scipy.stats import chi2
+
+
+def dagostino(n, M2, M3, M4):
+    """
+    D'Agostino and Pearson K² normality test from the number of observations and the sums of the
+    second, third and fourth powers of the deviations from the mean. Every argument may be an array,
+    in which case one test is computed per element. Requires at least 8 observations.
+
+	Parameters
+	----------
+    n : int or np.ndarray
+              number of observations
+    M2, M3, M4 : float or np.ndarray
+              sums of the powers of the deviations from the mean
+
+	Returns
+	-------
+    tuple
+        (statistic, p-value)
+    """
+    n = np.asarray(n, dtype = np.float64)
+    if (n < 8).any():
+        raise Exception('Normality test requires at least 8 observations.')
+    m2, m3, m4 = M2 / n, M3 / n, M4 / n
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        b2 = m3 / m2 ** 1.5
+        y = b2 * np.sqrt(((n + 1) * (n + 3)) / (6.0 * (n - 2)))
+        beta2 = (3.0 * (n ** 2 + 27 * n - 70) * (n + 1) * (n + 3) /
+                 ((n - 2.0) * (n + 5) * (n + 7) * (n + 9)))
+        W2 = -1 + np.sqrt(2 * (beta2 - 1))
+        delta = 1 / np.sqrt(0.5 * np.log(W2))
+        alpha = np.sqrt(2.0 / (W2 - 1))
+        y = np.where(y == 0, 1, y)
+        z_skew = delta * np.log(y / alpha + np.sqrt((y / alpha) ** 2 + 1))
+
+        b2 = m4 / m2 ** 2
+        E = 3.0 * (n - 1) / (n + 1)
+        varb2 = 24.0 * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.) * (n + 3) * (n + 5))
+        x = (b2 - E) / np.sqrt(varb2)
+        sqrtbeta1 = (6.0 * (n * n - 5 * n + 2) / ((n + 7) * (n + 9)) *
+                     np.sqrt((6.0 * (n + 3) * (n + 5)) / (n * (n - 2) * (n - 3))))
+        A = 6.0 + 8.0 / sqrtbeta1 * (2.0 / sqrtbeta1 + np.sqrt(1 + 4.0 / (sqrtbeta1 ** 2)))
+        term1 = 1 - 2 / (9.0 * A)
+        denom = 1 + x * np.sqrt(2 / (A - 4.0))
+        term2 = np.sign(denom) * np.where(denom == 0, np.nan, ((1 - 2.0 / A) / np.abs(denom)) ** (1 / 3.0))
+        z_kurtosis = (term1 - term2) / np.sqrt(2 / (9.0 * A))
+    statistic = z_skew ** 2 + z_kurtosis ** 2
+    return statistic, chi2.sf(statistic, 2)
+
+
+class Moments:
+    """
+    Running central moments (up to the fourth) of one or many samples, updated chunk by chunk.
+    Chunks are merged with the pairwise update formulas of Chan and Pébay, so two
+    Moments objects built over different parts of the data can also be merged.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        Moments
+        """
+        self.n = 0
+        self.mean = 0.
+        self.M2 = 0.
+        self.M3 = 0.
+        self.M4 = 0.
+
+    def update(self, chunk, weights = None):
+        """
+        Adds a chunk of observations, reducing over the first axis
+
+    	Parameters
+    	----------
+        chunk : array_like
+                  Array of sample data, 1-D for one sample or 2-D with one sample per column.
+        weights : array_like
+                  frequency of every row of the chunk, if None every row counts once
+
+    	Returns
+    	-------
+        Moments
+        """
+        chunk = np.asarray(chunk, dtype = np.float64)
+        if not len(chunk):
+            return self
+        other = Moments()
+        if weights is None:
+            other.n = len(chunk)
+            other.mean = chunk.mean(axis = 0)
+            centered = chunk - other.mean
+            squared = centered ** 2
+            other.M2 = squared.sum(axis = 0)
+            other.M3 = (squared * centered).sum(axis = 0)
+            other.M4 = (squared ** 2).sum(axis = 0)
+        else:
+            weights = np.asarray(weights, dtype = np.float64)
+            other.n = weights.sum()
+            if not other.n:
+                return self
+            other.mean = weights @ chunk / other.n
+            centered = chunk - other.mean
+            squared = centered ** 2
+            other.M2 = weights @ squared
+            other.M3 = weights @ (squared * centered)
+            other.M4 = weights @ (squared ** 2)
+        return self.merge(other)
+
+    def merge(self, other):
+        """
+        Merges the moments of another set of observations into this one
+
+    	Parameters
+    	----------
+        other : Moments
+                  moments of the other observations
+
+    	Returns
+    	-------
+        Moments
+        """
+        if not other.n:
+            return self
+        if not self.n:
+            self.n, self.mean, self.M2, self.M3, self.M4 = other.n, other.mean, other.M2, other.M3, other.M4
+            return self
+        na, nb = self.n, other.n
+        n = na + nb
+        delta = other.mean - self.mean
+        M2 = self.M2 + other.M2 + delta ** 2 * na * nb / n
+        M3 = (self.M3 + other.M3 + delta ** 3 * na * nb * (na - nb) / n ** 2
+              + 3 * delta * (na * other.M2 - nb * self.M2) / n)
+        M4 = (self.M4 + other.M4 + delta ** 4 * na * nb * (na ** 2 - na * nb + nb ** 2) / n ** 3
+              + 6 * delta ** 2 * (na ** 2 * other.M2 + nb ** 2 * self.M2) / n ** 2
+              + 4 * delta * (na * other.M3 - nb * self.M3) / n)
+        self.n, self.mean, self.M2, self.M3, self.M4 = n, self.mean + delta * nb / n, M2, M3, M4
+        return self
+
+    def normaltest(self):
+        """
+        D'Agostino and Pearson K² normality test computed from the accumulated moments,
+        identical to scipy.stats.normaltest on the full data. Requires at least 8 observations.
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        tuple
+            (statistic, p-value)
+        """
+        return dagostino(self.n, self.M2, self.M3, self.M4)
+
+
+    def jarque_bera(self):
+        """
+        Jarque-Bera normality test computed from the accumulated moments
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        tuple
+            (statistic, p-value)
+        """
+        n = np.asarray(self.n, dtype = np.float64)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            skewness = (self.M3 / n) / (self.M2 / n) ** 1.5
+            kurtosis = (self.M4 / n) / (self.M2 / n) ** 2
+        statistic = n / 6 * (skewness ** 2 + (kurtosis - 3) ** 2 / 4)
+        return statistic, chi2.sf(statistic, 2)
+
+class Comoments:
+    """
+    Running means, variances and covariance of a pair of samples (Welford-style co-moments),
+    enough to compute the Pearson correlation without holding the data in memory.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+
+    	Returns
+    	-------
+        Comoments
+        """
+        self.n = 0
+        self.mean_x, self.mean_y = 0., 0.
+        self.Cxx, self.Cyy, self.Cxy = 0., 0., 0.
+
+    def update(self, x, y, weights = None):
+        """
+        Adds a chunk of paired observations
+
+    	Parameters
+    	----------
+        x, y : array_like
+                  Arrays of sample data with the same length.
+        weights : array_like
+                  frequency of every pair, if None every pair counts once
+
+    	Returns
+    	-------
+        Comoments
+        """
+        x, y = np.asarray(x, dtype = np.float64), np.asarray(y, dtype = np.float64)
+        if len(x) != len(y):
+            raise Exception('Chunks of both samples must have the same length.')
+        if not len(x):
+            return self
+        other = Comoments()
+        if weights is None:
+            other.n = len(x)
+            other.mean_x, other.mean_y = x.mean(), y.mean()
+            dx, dy = x - other.mean_x, y - other.mean_y
+            other.Cxx, other.Cyy, other.Cxy = dx @ dx, dy @ dy, dx @ dy
+        else:
+            weights = np.asarray(weights, dtype = np.float64)
+            other.n = weights.sum()
+            if not other.n:
+                return self
+            other.mean_x, other.mean_y = weights @ x / other.n, weights @ y / other.n
+            dx, dy = x - other.mean_x, y - other.mean_y
+            wx = weights * dx
+            other.Cxx, other.Cyy, other.Cxy = wx @ dx, (weights * dy) @ dy, wx @ dy
+        return self.merge(other)
+
+    def merge(self, other):
+        """
+        Merges the co-moments of another set of paired observations into this one
+
+    	Parameters
+    	----------
+        other : Comoments
+                  co-moments of the other observations
+
+    	Returns
+    	-------
+        Comoments
+        """
+        if not other.n:
+            return self
+        na, nb = self.n, other.n
+        n = na + nb
+        dx, dy = other.mean_x - self.mean_x, other.mean_y - self.mean_y
+        factor = na * nb / n
+        self.Cxx += other.Cxx + dx * dx * factor
+        self.Cyy += other.Cyy + dy * dy * factor
+        self.Cxy += other.Cxy + dx * dy * factor
+        self.mean_x += dx * nb / n
+        self.mean_y += dy * nb / n
+        self.n = n
+        return self
+
+    @property
+    def r(self):
+        """
+        Pearson correlation coefficient of the accumulated observations
+        """
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return float(np.clip(self.Cxy / np.sqrt(self.Cxx * self.Cyy), -1, 1))
+
+
+def weighted_ranks(values, weights):
+    """
+    Ranks (average method) the observations would have if every value were repeated as many times as its weight,
+    so that rank statistics can be computed on pre-aggregated samples
+
+	Parameters
+	----------
+    values : array_like
+              Array of sample data.
+    weights : array_like
+              frequency of every value
+
+	Returns
+	-------
+    np.ndarray
+        rank of every value
+    """
+    distinct, inverse = np.unique(np.asarray(values), return_inverse = True)
+    counts = np.bincount(inverse.ravel(), weights = np.asarray(weights, dtype = np.float64), minlength = len(distinct))
+    below = np.cumsum(counts) - counts
+    return (below + (counts + 1) / 2)[inverse.ravel()]
+
+
+class PairSample:
+    """
+    Uniform sample without replacement of at most `size` paired observations from a stream
+    (bottom-k sampling: every observation gets a random key and the smallest keys are kept).
+    Two samples built with different seeds over disjoint parts of the stream can be merged.
+    """
+
+    def __init__(self, size = 100_000, seed = None):
+        """
+        Constructor
+
+    	Parameters
+    	----------
+        size : int
+                  maximum number of pairs kept
+        seed : int
+                  seed of the random number generator
+
+    	Returns
+    	-------
+        PairSample
+        """
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.n = 0
+        self.keys = np.empty(0)
+        self.x, self.y = np.empty(0), np.empty(0)
+
+    def update(self, x, y):
+        """
+        Adds a chunk of paired observations
+
+    	Parameters
+    	----------
+        x, y : array_like
+                  Arrays of sample data with the same length.
+
+    	Returns
+    	-------
+        PairSample
+        """
+        x, y = np.asarray(x, dtype = np.float64), np.asarray(y, dtype = np.float64)
+        if len(x) != len(y):
+            raise Exception('Chunks of both samples must have the same length.')
+        self.n += len(x)
+        return self._keep(self.rng.random(len(x)), x, y)
+
+    def merge(self, other):
+        """
+        Merges another sample of the same stream into this one
+
+    	Parameters
+    	----------
+        other : PairSample
+                  sample of the other observations
+
+    	Returns
+    	-------
+        PairSample
+        """
+        self.n += other.n
+        return self._keep(other.keys, other.x, other.y)
+
+    def _keep(self, keys, x, y):
+        keys = np.concatenate([self.keys, keys])
+        x, y = np.concatenate([self.x, x]), np.concatenate([self.y, y])
+        if len(keys) > self.size:
+            kept = np.argpartition(keys, self.size)[:self.size]
+            keys, x, y = keys[kept], x[kept], y[kept]
+        self.keys, self.x, self.y = keys, x, y
+        return self
@@ -0,0 +1,24 @@
+import numpy as np
+from ml.preprocessing.power import PowerGrid, power
+
+
+def test_two_sided_ttest_power_large_effects():
+    result = power('ttest', [1.9, 3., 5.], [50, 1000, 10 ** 6])
+    assert not np.isnan(result).any()
+    assert np.allclose(result, 1.)
+
+
+def test_grid_has_no_nan():
+    grid = PowerGrid('ttest')
+    assert not np.isnan(grid.table).any()
+    assert np.isclose(grid.power(1.9, 50), 1., atol = 1e-3)
+
+
+def test_grid_matches_exact_power_for_every_alternative():
+    for test, effects, sizes in [('correlation', [-0.3, -0.05, 0.1, 0.3], [20, 100, 5000]),
+                                 ('ttest', [-0.8, -0.2, 0.1, 0.5], [10, 100, 2000])]:
+        for alternative in ('two-sided', 'greater', 'less'):
+            grid = PowerGrid(test, alternative = alternative)
+            effect, n = np.meshgrid(effects, sizes)
+            exact = power(test, effect, n, alternative = alternative)
+            assert np.allclose(grid.power(effect, n), exact, atol = 2e-3), (test, alternative)